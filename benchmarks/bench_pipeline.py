@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# benchmarks for the map render stages, date_column and ingestion
+# run from project root:
+#   python benchmarks/bench_pipeline.py --sizes 1e3,1e5,1e7 --regions states,counties
+#   python benchmarks/bench_pipeline.py --compare results/old.json results/new.json
+# import packages
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import shiny_functions as sf
+import classify_functions as cf
+import general_functions as gf
+import ingest_data as ing
+
+# results directory
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# regions per grain
+REGIONS = {"states": 51, "counties": 3200}
+# months covered by synthetic data
+MONTHS = 48
+# value columns, same as the app
+VALUE_LIST = ["count", "#_injured", "#_killed", "total_injured_killed"]
+SORT_LIST = ["count", "#_injured", "#_killed"]
+COL_LIST = ["count", "#_injured", "#_killed", "total_injured_killed"]
+NEW_COL_LIST = ["count_per_1k", "injured_per_1k", "killed_per_1k", "total_per_1k"]
+
+# function to create synthetic incidents
+def synthetic_incidents(n, n_regions, seed=0):
+    """
+    Pass number of incidents and regions.
+    Returns df shaped like a cleaned GVA export
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2019-01-01")
+    return pd.DataFrame({
+        "incident_id": np.arange(n, dtype=np.int64) + 1_000_000,
+        "incident_date": start + rng.integers(0, MONTHS * 30, n).astype("timedelta64[D]"),
+        "state": pd.Categorical.from_codes(rng.integers(0, n_regions, n),
+                                           [f"region_{i:04d}" for i in range(n_regions)]),
+        "city_or_county": pd.Categorical.from_codes(rng.integers(0, 500, n),
+                                                    [f"city_{i}" for i in range(500)]),
+        "address": pd.array([f"{i} Main St" for i in rng.integers(0, 9999, n)],
+                            dtype="string"),
+        "#_killed": rng.poisson(1, n).astype(np.int16),
+        "#_injured": rng.poisson(4, n).astype(np.int16),
+    })
+
+# function to create monthly table from incidents
+def synthetic_monthly(df):
+    """
+    Pass synthetic incidents.
+    Returns df laid out like df_yr_mon_state
+    """
+    return ing.monthly_aggregates(df, exclude_states=[])
+
+# function to create synthetic census
+def synthetic_census(n_regions, seed=0):
+    """
+    Pass number of regions.
+    Returns df of state, population and state_fips
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"state": [f"region_{i:04d}" for i in range(n_regions)],
+                         "population": rng.integers(5_000, 10_000_000, n_regions)
+                         .astype(float),
+                         "state_fips": [f"{i:05d}" for i in range(n_regions)]})
+
+# function to create synthetic gun laws
+def synthetic_laws(n_regions, seed=0):
+    """
+    Pass number of regions.
+    Returns df of state and lawtotal
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"state": [f"region_{i:04d}" for i in range(n_regions)],
+                         "lawtotal": rng.integers(0, 110, n_regions)})
+
+# function to create synthetic geometry cache
+def synthetic_geometry(census, vertices=200):
+    """
+    Pass synthetic census.
+    Returns geometry cache of one polygon per region
+    """
+    angle = np.linspace(0, 2 * np.pi, vertices)
+    cache = {}
+    for (i, fips) in enumerate(census["state_fips"]):
+        x, y = -120 + (i % 60), 25 + (i // 60) % 25
+        ring = np.round(np.column_stack([x + 0.4 * np.cos(angle),
+                                         y + 0.4 * np.sin(angle)]), 5).tolist()
+        cache[fips] = {"id": fips, "type": "Feature",
+                       "properties": {"stusps": fips, "name": census["state"][i]},
+                       "geometry": {"type": "Polygon", "coordinates": [ring]}}
+    return cache
+
+# function to time a stage
+def time_stage(func, repeat):
+    """
+    Pass function without arguments and number of repeats.
+    Returns dict of min and median seconds
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return {"min": min(times), "median": float(np.median(times))}
+
+# function to ingest into an empty store
+def ingest_once(export_dir):
+    """
+    Pass directory of GVA exports.
+    Runs the full ingest (read, dedup, append, monthly aggregates)
+    into a new store that is removed after.
+    Returns number of new rows
+    """
+    store = tempfile.mkdtemp(prefix="bench-store-")
+    try:
+        return ing.ingest(export_dir, store)
+    finally:
+        shutil.rmtree(store)
+
+# function to benchmark one data size
+def bench_size(n, grain, repeat, tmp_path):
+    """
+    Pass number of incidents, region grain, repeats and a scratch
+    directory for the export csv.
+    Runs every stage of the map render plus date_column and
+    ingestion on synthetic data.
+    Returns dict of stage -> timings
+    """
+    n_regions = REGIONS[grain]
+    incidents = synthetic_incidents(n, n_regions)
+    df = synthetic_monthly(incidents)
+    df["date"] = df["date"].dt.date
+    census = synthetic_census(n_regions)
+    laws = synthetic_laws(n_regions)
+    geometry_cache = synthetic_geometry(census)
+    start, end = df["date"].min(), df["date"].max()
+    cube = sf.build_cumulative_cube(df, VALUE_LIST)
+
+    # each stage gets the previous stage output
+    df_range = df[(df["date"] >= start) & (df["date"] < end)]
+    df_grouped = sf.groupby_mult(df_range, ["state"],
+                                 {col: "sum" for col in VALUE_LIST}, SORT_LIST)
+    df_census = df_grouped.merge(census, how="outer")
+    df_rate = sf.rate_table(df_census, COL_LIST, NEW_COL_LIST, decimals=2)
+    gdf = df_rate.merge(laws, how="outer").set_index("state_fips")
+
+    stages = {
+        "date_filter": lambda: df[(df["date"] >= start) & (df["date"] < end)],
+        "groupby_mult": lambda: sf.groupby_mult(df_range, ["state"],
+                                                {col: "sum" for col in VALUE_LIST},
+                                                SORT_LIST),
+        "build_cube": lambda: sf.build_cumulative_cube(df, VALUE_LIST),
+        "cube_range_sum": lambda: sf.cube_range_sum(cube, start, end, SORT_LIST),
+        "census_merge": lambda: df_grouped.merge(census, how="outer"),
+        "rate_per_1k": lambda: sf.rate_per_1k(df_census.copy(), COL_LIST, NEW_COL_LIST),
+        "rate_table": lambda: sf.rate_table(df_census, COL_LIST, NEW_COL_LIST, decimals=2),
+        "law_merge": lambda: df_rate.merge(laws, how="outer"),
+        "divide_metric": lambda: sf.divide_metric(df_rate, "count_per_1k"),
+        "classify_jenks": lambda: cf.classify(df_rate["count_per_1k"], cf.CLASSES, "jenks"),
+        "classify_quantile": lambda: cf.classify(df_rate["count_per_1k"], cf.CLASSES,
+                                                 "quantile"),
+        "geojson_build": lambda: sf.patch_geojson(geometry_cache, gdf),
+        "date_column": lambda: gf.date_column(incidents[["incident_date"]].copy(),
+                                              "incident_date"),
+    }
+    # widget build needs ipyleaflet, ipywidgets and branca colormaps
+    try:
+        from branca.colormap import linear
+        import ipyleaflet
+        import ipywidgets
+        geojson = sf.patch_geojson(geometry_cache, gdf)
+        metric = cf.classify(df_rate["count_per_1k"], cf.CLASSES, "jenks")
+        rgb_list = cf.class_colors(sf.rgb_to_hex(linear.Blues_07.colors), len(metric) - 1)
+        stages["int_choro_ipyleaflet"] = lambda: sf.int_choro_ipyleaflet(
+            geojson, gdf, "count_per_1k", "Shooting per 1k", metric, rgb_list,
+            linear.Blues_07)
+    except ImportError:
+        pass
+
+    # ingestion reads a csv written like a GVA export
+    csv_file = os.path.join(tmp_path, f"export-bench-{n}-{grain}.csv")
+    export = incidents.rename(columns={"incident_id": "Incident ID",
+        "incident_date": "Incident Date", "state": "State",
+        "city_or_county": "City Or County", "address": "Address",
+        "#_killed": "# Killed", "#_injured": "# Injured"})
+    export["Incident Date"] = export["Incident Date"].dt.strftime(ing.DATE_FORMAT)
+    export.to_csv(csv_file, index=False)
+    stages["read_export_chunks"] = lambda: sum(len(chunk) for chunk in
+                                               ing.read_export_chunks(csv_file))
+    stages["ingest"] = lambda: ingest_once(tmp_path)
+
+    results = {}
+    for (name, func) in stages.items():
+        results[name] = time_stage(func, repeat)
+        print(f"{grain:>8} {n:>10,} {name:<22} {results[name]['median'] * 1000:10.2f} ms")
+    os.remove(csv_file)
+    return results
+
+# function to get current commit
+def git_commit():
+    """
+    Returns short hash of HEAD or "unknown"
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# function to run benchmarks
+def run(sizes, grains, repeat, path=RESULTS_PATH):
+    """
+    Pass list of incident counts, region grains and repeats.
+    Saves results to <path>/<commit>-<time>.json, exports are
+    written to a temp directory.
+    Returns results dict
+    """
+    os.makedirs(path, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix="bench-")
+    results = {"commit": git_commit(),
+               "time": datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(),
+               "pandas": pd.__version__, "numpy": np.__version__,
+               "repeat": repeat, "runs": []}
+    try:
+        for grain in grains:
+            for n in sizes:
+                results["runs"].append({"n": n, "grain": grain,
+                                        "stages": bench_size(n, grain, repeat, tmp_path)})
+    finally:
+        shutil.rmtree(tmp_path)
+    file = os.path.join(path, f"{results['commit']}-{datetime.now():%Y%m%d%H%M%S}.json")
+    with open(file, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {file}")
+    return results
+
+# function to compare two result files
+def compare(old_file, new_file):
+    """
+    Pass two result files.
+    Prints median time ratio new / old for every shared stage
+    """
+    with open(old_file) as f:
+        old = json.load(f)
+    with open(new_file) as f:
+        new = json.load(f)
+    old_runs = {(run["grain"], run["n"]): run["stages"] for run in old["runs"]}
+    print(f"{old['commit']} -> {new['commit']}")
+    for run in new["runs"]:
+        old_stages = old_runs.get((run["grain"], run["n"]), {})
+        for (name, timing) in run["stages"].items():
+            if name not in old_stages:
+                continue
+            ratio = timing["median"] / old_stages[name]["median"]
+            print(f"{run['grain']:>8} {run['n']:>10,} {name:<22} {ratio:6.2f}x")
+
+# function to run from command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark map pipeline stages")
+    parser.add_argument("--sizes", default="1e3,1e4,1e5,1e6",
+                        help="comma separated incident counts, up to 1e7")
+    parser.add_argument("--regions", default="states,counties",
+                        help="comma separated region grains: states, counties")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return 0
+    sizes = [int(float(size)) for size in args.sizes.split(",")]
+    run(sizes, args.regions.split(","), args.repeat)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
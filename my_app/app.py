@@ -1,37 +1,82 @@
 # import packages
-import pandas as pd
-import geopandas as gpd
+import os
 from shiny import App, reactive, ui
-from shinywidgets import output_widget, render_widget
-import json
+from shinywidgets import output_widget, register_widget
 from branca.colormap import linear
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response
+from starlette.routing import Mount, Route
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import datetime
+import functools
+import gzip
+import logging
 
 # import functions
 import shiny_functions as sf
+import classify_functions as cf
+import app_data as ad
+import data_store as ds
+import metrics
+import view_jobs
+
+# logger for failed map views
+logger = logging.getLogger("app")
 
 # import data
-df = pd.read_pickle('data//df_yr_mon_state')
-us_shp = gpd.GeoDataFrame(pd.read_pickle('data/us_shp'))
-df_gun_laws = pd.read_pickle('data/df_gun_laws')
-df_census = pd.read_pickle('data/df_us_census')
+# APP_SHARED_DATA=<dir> shares one copy between worker processes
+app_data = ad.get_app_data('data', os.environ.get("APP_SHARED_DATA"))
+df_gun_laws = app_data["df_gun_laws"]
+# data for each map grain, key is the region id col
+grains = app_data["grains"]
+# county mode, only when county data has been built
+county_mode = "county" in grains
+# states left out of the aggregates (data_store.EXCLUDE_STATES) are
+# no data, other regions with population but no incidents are 0
+rate_census_dict = {grain: data["census"][~data["census"]["state"].isin(ds.EXCLUDE_STATES)]
+                    for (grain, data) in grains.items()}
 
 # set variables
 # start and end date
-start_date = min(df["date"])
-end_date = max(df["date"])
-# legend color dict
-legend_color_dict = {
-    "count_per_1k":linear.Blues_07.colors,
-    "injured_per_1k":linear.Greens_07.colors,
-    "killed_per_1k":linear.Reds_07.colors}
+start_date = app_data["start_date"]
+end_date = app_data["end_date"]
+sort_list = ["count","#_injured","#_killed"]
+# legend hex colors per metric, prebuilt in the runtime bundle
+legend_color_dict = app_data["legend_colors"]
 # map color dict
-map_color_dict = {
-    "count_per_1k":linear.Blues_07,
-    "injured_per_1k":linear.Greens_07,
-    "killed_per_1k":linear.Reds_07}
+map_color_dict = {metric: getattr(linear, palette)
+                  for (metric, palette) in ad.PALETTES.items()}
+# rate columns
+col_list = ["count","#_injured", "#_killed", "total_injured_killed"]
+new_col_list = ["count_per_1k", "injured_per_1k","killed_per_1k","total_per_1k"]
+# number of date ranges / metric views kept in cache
+cache_size = 64
+# threads computing map views off the event loop
+map_workers = 2
 # radio button dict
 radio_button_dict={"count_per_1k":"Shooting per 1k", 
     "injured_per_1k":"Injured per 1k", "killed_per_1k":"Killed per 1k"}
+# grain radio button dict
+grain_button_dict={"state":"States", "county":"Counties"}
+# legend class scheme radio button dict
+scheme_button_dict={"jenks":"Natural breaks", "quantile":"Quantile",
+    "equal_interval":"Equal interval"}
+# months summed per playback frame
+playback_window_dict={"1":"1 month", "3":"3 months", "12":"12 months"}
+# regions drawn as a layer each in playback, more (counties) are
+# played on the map's one choropleth layer
+playback_layer_max = 100
+# number of playback frames
+n_frames = len(grains["state"]["cube"]["months"])
+# export api formats and media types
+export_media_dict={"json":"application/json", "csv":"text/csv; charset=utf-8"}
+# export names of rate columns, *_per_1k cols are per 100k people
+export_rate_dict={col: col.replace("_per_1k", "_per_100k") for col in new_col_list}
+# export end is exclusive, first day after the last month of data
+export_end_date = (end_date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+# seconds clients may reuse an export before checking its ETag
+export_max_age = 300
 
 app_ui = ui.page_fluid(
     ui.h1({"style": "text-align: center;"}, "Mass Shootings in the US"),
@@ -65,6 +110,10 @@ app_ui = ui.page_fluid(
                 2,
                 # radio button selection
                 ui.input_radio_buttons("maptype","Select Metric",radio_button_dict),
+                # county drill down when county data is built
+                ui.input_radio_buttons("grain","Select Regions",grain_button_dict) \
+                    if county_mode else None,
+                ui.input_radio_buttons("scheme","Legend Classes",scheme_button_dict),
             ),
             ui.column(1,
                 ui.input_action_button("computedate","Change Date")
@@ -80,69 +129,475 @@ app_ui = ui.page_fluid(
                                     format="yyyy-M-dd")
             ),
         ),
+        ui.row(
+            ui.column(
+                2,
+                # month by month playback
+                ui.input_checkbox("playback","Play by month"),
+            ),
+            ui.column(
+                2,
+                ui.input_select("window","Months per frame",playback_window_dict),
+            ),
+            ui.column(
+                8,
+                ui.input_slider("frame","Month",min=0,max=n_frames-1,value=0,
+                                step=1,animate=True,width="100%"),
+            ),
+        ),
     ),
 )
 
+# rates for date range, cached and shared by the map and export api
+@functools.lru_cache(maxsize=cache_size)
+def rate_range(start, end, grain="state"):
+    """
+    Sums states (or counties) over date range, joins census and
+    gun laws and creates rate per 1k columns.
+    Returns numeric df indexed by state_fips (county_fips) of regions
+    with geometry, shared so must not be changed
+    """
+    data = grains[grain]
+    geometry_cache = data["geometry_cache"]
+    # sum regions over date range from cube
+    with metrics.stage("cube_range_sum"):
+        df_input = sf.cube_range_sum(data["cube"], start, end, sort_list)
+
+    # join census data
+    with metrics.stage("census_merge"):
+        df_input = df_input.merge(rate_census_dict[grain], how="outer")
+
+    # get ratio per state with 95% intervals
+    with metrics.stage("rate_table"):
+        df_input = sf.rate_table(df_input, col_list, new_col_list, decimals=2)
+        df_input["pop_per_1k"] = df_input["population"] / 1000
+
+    # join with gun laws
+    with metrics.stage("law_merge"):
+        df_input = df_input.merge(df_gun_laws, how="outer")
+        # reset index and keep regions with geometry
+        df_input.set_index(data["key"], inplace=True)
+        return df_input[df_input.index.isin(list(geometry_cache))]
+
+# aggregate date range, cached and shared by all sessions
+@functools.lru_cache(maxsize=cache_size)
+def aggregate_range(start, end, grain="state"):
+    """
+    Formats rate_range for the map.
+    Returns df indexed by state_fips (county_fips) and GeoJSON with
+    cached geometry, both shared so must not be changed
+    """
+    gdf = rate_range(start, end, grain).copy()
+    # format pop cols
+    with metrics.stage("format_cols"):
+        gdf["population"]=gdf["population"].map('{:,.0f}'.format)
+        gdf["pop_per_1k"]=gdf["pop_per_1k"].map('{:,.0f}'.format)
+
+    # create GeoJSON from cached geometry
+    with metrics.stage("geojson_build"):
+        geojson_gdf=sf.patch_geojson(grains[grain]["geometry_cache"], gdf)
+    return gdf, geojson_gdf
+
+# legend classes for metric, cached and shared by all sessions
+@functools.lru_cache(maxsize=cache_size)
+def present_metric(start, end, map_color, grain="state", scheme="jenks"):
+    """
+    Pass date range, metric column, grain and class scheme.
+    Returns legend class edges and one hex color per class
+    """
+    gdf, _ = aggregate_range(start, end, grain)
+    with metrics.stage("classify"):
+        metric = cf.classify(gdf[map_color], cf.CLASSES, scheme)
+    rgb_list = cf.class_colors(legend_color_dict[map_color], len(metric) - 1)
+    return metric, rgb_list
+
+# rates for every month, cached and shared by all sessions
+@functools.lru_cache(maxsize=8)
+def playback_frames(grain="state", window=1):
+    """
+    Pass grain and months per frame.
+    Returns frames from build_frames in map feature order
+    """
+    data = grains[grain]
+    with metrics.stage("build_frames"):
+        return sf.build_frames(data["cube"], rate_census_dict[grain], data["key"],
+                               col_list, new_col_list, data["keys"], window)
+
+# color classes for every month, cached and shared by all sessions
+@functools.lru_cache(maxsize=cache_size)
+def playback_bins(grain, window, map_color, scheme="jenks"):
+    """
+    Pass grain, months per frame, metric column and class scheme.
+    One set of classes over all months so colors compare across frames.
+    Returns legend class edges, months x regions classes and hex colors
+    """
+    frames = playback_frames(grain, window)
+    values = frames["rates"][:, :, frames["metrics"].index(map_color)]
+    with metrics.stage("classify"):
+        breaks = cf.classify(values.ravel(), cf.CLASSES, scheme)
+        bins = cf.class_bins(values, breaks)
+    return breaks, bins, cf.class_colors(legend_color_dict[map_color], len(breaks) - 1)
+
+# function to get cache hits and misses
+def cache_stats():
+    """
+    Returns dict of hits, misses and size for each cache
+    """
+    return {cache.__name__: cache.cache_info()._asdict()
+            for cache in (rate_range, aggregate_range, present_metric,
+                          playback_frames, playback_bins, export_body)}
+
+# map view for date range, metric and grain, run in executor
+def compute_view(start, end, map_color, grain="state", scheme="jenks"):
+    """
+    Pass date range, metric column, grain and class scheme.
+    Returns dict of grain, aggregated gdf, GeoJSON, legend breaks and colors
+    """
+    with metrics.render("map", metric=map_color, grain=grain,
+                        start=str(start), end=str(end)):
+        with metrics.stage("aggregate_range"):
+            gdf, geojson_gdf = aggregate_range(start, end, grain)
+        with metrics.stage("present_metric"):
+            metric, rgb_list = present_metric(start, end, map_color, grain, scheme)
+    return {"map_color": map_color, "grain": grain, "gdf": gdf,
+            "geojson_gdf": geojson_gdf, "metric": metric, "rgb_list": rgb_list}
+
+# playback classes for grain, window and metric, run in executor
+def compute_playback(region_grain, window, map_color, scheme="jenks"):
+    """
+    Pass grain, months per frame, metric column and class scheme.
+    Returns dict of grain, window, metric, months, map keys, months x
+    keys rates, legend breaks, months x keys classes and colors
+    """
+    with metrics.render("playback_bins", metric=map_color, grain=region_grain,
+                        window=window):
+        frames = playback_frames(region_grain, window)
+        breaks, bins, rgb_list = playback_bins(region_grain, window, map_color, scheme)
+    return {"grain": region_grain, "window": window, "map_color": map_color,
+            "months": frames["months"], "keys": frames["keys"],
+            "rates": frames["rates"][:, :, frames["metrics"].index(map_color)],
+            "breaks": breaks, "bins": bins, "rgb_list": rgb_list}
+
+# threads computing map views, jobs are shared by sessions asking
+# for the same view
+executor = ThreadPoolExecutor(max_workers=map_workers, thread_name_prefix="map")
+
+# function to start or join computing a view
+def submit_view(key, compute=compute_view):
+    """
+    Pass args of compute, (start, end, map_color, grain, scheme) for
+    compute_view or (grain, window, map_color, scheme) for
+    compute_playback.
+    Returns future of compute, shared while it is running
+    """
+    return view_jobs.submit(executor, compute, key)
+
+# function to stop waiting for view
+def release_view(key, future, compute=compute_view):
+    """
+    Pass args and compute passed to submit_view and its future.
+    Cancels the view if nobody waits for it and it hasn't started
+    """
+    view_jobs.release(compute, key, future)
+
+# export body for date range and metric, cached and shared by all requests
+@functools.lru_cache(maxsize=cache_size)
+def export_body(start, end, metric=None, grain="state", fmt="json"):
+    """
+    Pass date range, rate column (None for all), grain and format.
+    Returns gzip compressed JSON records or CSV of region sums,
+    population, gun laws and rates per 100k with 95% intervals,
+    rate columns named as in export_rate_dict
+    """
+    with metrics.render("export", metric=str(metric), grain=grain,
+                        start=str(start), end=str(end)):
+        df = rate_range(start, end, grain)
+        with metrics.stage("export_cols"):
+            if metric is not None:
+                drop = [col for (value, rate) in zip(col_list, new_col_list)
+                        if rate != metric
+                        for col in (value, rate, f"{rate}_low", f"{rate}_high")]
+                df = df.drop(columns=drop)
+            df = df.drop(columns="pop_per_1k").reset_index()
+            # merges and rate_table leave counts as floats, export
+            # them as integers (missing when the region has no row)
+            counts = [col for col in col_list if col in df.columns]
+            df[counts] = df[counts].round().astype("Int64")
+            df = df.rename(columns={f"{col}{suffix}": f"{name}{suffix}"
+                                    for (col, name) in export_rate_dict.items()
+                                    for suffix in ("", "_low", "_high")})
+        with metrics.stage("export_write"):
+            body = df.to_json(orient="records") if fmt == "json" \
+                else df.to_csv(index=False)
+            return gzip.compress(body.encode())
+
+# function to read export query
+def export_query(params):
+    """
+    Pass request query params: start, end (YYYY-MM-DD, end exclusive,
+    default full range, clipped to the data), metric (rate per 100k
+    column, default all), grain and format (json or csv).
+    Returns (start, end, metric, grain, format), raises ValueError
+    """
+    start = datetime.date.fromisoformat(params.get("start", str(start_date)))
+    end = datetime.date.fromisoformat(params.get("end", str(export_end_date)))
+    start, end = max(start, start_date), min(end, export_end_date)
+    if start > end:
+        raise ValueError("start must not be after end")
+    metric = params.get("metric") or None
+    if metric is not None:
+        names = {name: col for (col, name) in export_rate_dict.items()}
+        if metric not in names:
+            raise ValueError(f"metric must be one of {', '.join(names)}")
+        metric = names[metric]
+    grain = params.get("grain", "state")
+    if grain not in grains:
+        raise ValueError(f"grain must be one of {', '.join(grains)}")
+    fmt = params.get("format", "json")
+    if fmt not in export_media_dict:
+        raise ValueError(f"format must be one of {', '.join(export_media_dict)}")
+    return start, end, metric, grain, fmt
+
+# function to create export ETag
+def export_etag(start, end, metric, grain, fmt):
+    """
+    Pass export key.
+    Returns ETag of data version and key, known without building the body
+    """
+    return f'"{app_data["data_version"]}-{start}-{end}-{metric or "all"}-{grain}-{fmt}"'
+
+# thread building exports so polls don't hold up map views
+export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
 def server(input, output, session):
+    # persistent map for this session, updated in place
+    map_parts = sf.create_choro_ipyleaflet(sf.parse_geometry(grains["state"]["geometry"]))
+    register_widget("map", map_parts["widget"])
+
     @reactive.Calc
-    def datechange():
-        df_input=df[(df["date"] >= input.daterange()[0]) & (df["date"] < input.daterange()[1])]
-        return df_input
-    
-    @output
-    @render_widget
-    def map():
+    def daterange():
+        # date range only changes on button press
         input.computedate()
-        # add rgb to list
-        map_color = input.maptype()
-        rgb_list = sf.rgb_to_hex(legend_color_dict[map_color])
+        with reactive.isolate():
+            start, end = input.daterange()
+        return start, end
 
-        # # filter df by user input
-        # df_input=df[(df["date"] >= input.daterange()[0]) & (df["date"] < input.daterange()[1])]
+    @reactive.Calc
+    def grain():
+        return input.grain() if county_mode else "state"
 
-        # sum up variables for plot
-        # group subset by state
-        # create variables for function
-        with reactive.isolate():
-            groupby_list = ["state"]
-            agg_dict = {"count":"sum","#_injured":"sum","#_killed":"sum","total_injured_killed":"sum"}
-            sort_list = ["count","#_injured","#_killed"]
-            # apply function
-            df_input = sf.groupby_mult(datechange(), groupby_list, agg_dict, sort_list)
-
-            # join census data
-            df_input = df_input.merge(df_census, how="outer")
-
-            # get ratio per state
-            # create lists for function
-            col_list = ["count","#_injured", "#_killed", "total_injured_killed"]
-            new_col_list = ["count_per_1k", "injured_per_1k","killed_per_1k","total_per_1k"]
-            # apply function
-            sf.rate_per_1k(df_input, col_list, new_col_list)
-
-            # create divide metric
-            metric=sf.divide_metric(df_input,input.maptype())
-
-            # join with gun laws
-            df_input = df_input.merge(df_gun_laws, how="outer")
-            gdf = gpd.GeoDataFrame(df_input.merge(us_shp, left_on="state", right_on="name"))
-            # reset index
-            gdf.set_index("state_fips", inplace=True)
-
-            # format pop cols
-            gdf["population"]=gdf["population"].map('{:,.0f}'.format)
-            gdf["pop_per_1k"]=gdf["pop_per_1k"].map('{:,.0f}'.format)
-
-            # create GeoJSON from gdf
-            geojson_gdf=gdf.to_json()
-            geojson_gdf=json.loads(geojson_gdf)
+    # latest requested view and the finished view shown on the map
+    request = {"key": None, "future": None, "task": None}
+    view = reactive.Value(None)
+    # same for playback classes
+    playback_request = {"key": None, "future": None, "task": None}
+    playback_view = reactive.Value(None)
+
+    # function to wait for view off the event loop
+    async def deliver(key, future, pending, shown, retry):
+        """
+        Pass key and future of view, its request dict, reactive value
+        set to the view and message shown when it fails
+        """
+        try:
+            result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            return
+        except Exception:
+            logger.exception("map view %s failed", key)
+            if key != pending["key"]:
+                return
+            # forget the request so asking again retries
+            pending["key"] = None
+            map_parts["label"].value = retry
+            return
+        # a newer request came in, drop this result
+        if key != pending["key"]:
+            return
+        async with reactive.lock():
+            shown.set(result)
+            await reactive.flush()
+
+    @reactive.Effect
+    def request_view():
+        key = (*daterange(), input.maptype(), grain(), input.scheme())
+        if key == request["key"]:
+            return
+        # cancel the previous view if it is still queued
+        if request["key"] is not None:
+            release_view(request["key"], request["future"])
+        request["key"], request["future"] = key, submit_view(key)
+        request["task"] = asyncio.create_task(deliver(
+            key, request["future"], request, view,
+            "Could not compute the map for this selection, press Change Date to retry"))
+
+    @reactive.Effect
+    def request_playback():
+        key = (grain(), int(input.window()), input.maptype(), input.scheme()) \
+            if input.playback() else None
+        if key == playback_request["key"]:
+            return
+        # cancel the previous classes if they are still queued
+        if playback_request["key"] is not None:
+            release_view(playback_request["key"], playback_request["future"],
+                         compute_playback)
+        if key is None:
+            playback_request["key"] = None
+            playback_view.set(None)
+            return
+        playback_request["key"] = key
+        playback_request["future"] = submit_view(key, compute_playback)
+        playback_request["task"] = asyncio.create_task(deliver(
+            key, playback_request["future"], playback_request, playback_view,
+            "Could not compute playback for this selection, change a setting to retry"))
+
+    @session.on_ended
+    def cancel_view():
+        if request["key"] is not None:
+            release_view(request["key"], request["future"])
+            request["key"] = None
+        if playback_request["key"] is not None:
+            release_view(playback_request["key"], playback_request["future"],
+                         compute_playback)
+            playback_request["key"] = None
+
+    # grain whose geometry the map has
+    map_grain = {"grain": "state"}
+
+    # function to show choropleth with geometry of grain
+    def show_choro(region_grain):
+        basemap = map_parts["map"]
+        if map_parts["choro_layer"] not in basemap.layers:
+            basemap.add_layer(map_parts["choro_layer"])
+        # send new geometry only when grain changes
+        if region_grain != map_grain["grain"]:
+            with metrics.stage("set_geometry"):
+                sf.set_choro_geometry(map_parts,
+                                      sf.parse_geometry(grains[region_grain]["geometry"]))
+            map_grain["grain"] = region_grain
+
+    @reactive.Effect
+    def map():
+        result = view()
+        # playback takes over the map, redraw when it stops
+        if result is None or input.playback():
+            return
+        map_color = result["map_color"]
+        with metrics.render("map_update", metric=map_color, grain=result["grain"]):
+            show_choro(result["grain"])
 
             # select name for plot
-            title = input.maptype()
-            title = radio_button_dict[title]
-
-            # use function to plot
-            return sf.int_choro_ipyleaflet(geojson_gdf, gdf=gdf, 
-            value=input.maptype(),title=title,metric=metric, rgb_list=rgb_list, colormap=map_color_dict[map_color])
-    
-app = App(app_ui, server)
+            title = radio_button_dict[map_color]
+
+            # use function to update map
+            with metrics.stage("update_map"):
+                sf.update_choro_ipyleaflet(map_parts, result["geojson_gdf"], gdf=result["gdf"],
+                value=map_color,title=title,metric=result["metric"], rgb_list=result["rgb_list"],
+                colormap=map_color_dict[map_color])
+
+    # playback layers per grain, made on first use
+    playback_parts = {}
+    # classes and frame shown by playback and its layers on the map
+    # (None when playing on the choropleth)
+    playback_state = {"result": None, "frame": 0, "layers": None}
+
+    # function to take playback layers off the map
+    def hide_playback_layers():
+        if playback_state["layers"] is not None:
+            map_parts["map"].remove_layer(playback_state["layers"]["group"])
+            playback_state["layers"] = None
+
+    # function to show playback value of hovered region
+    def playback_hover(key):
+        result = playback_state["result"]
+        if result is None or key not in result["keys"]:
+            return
+        value = result["rates"][playback_state["frame"], result["keys"].index(key)]
+        properties = grains[result["grain"]]["geometry_cache"][key]["properties"]
+        place = properties.get("namelsad") or properties.get("name")
+        map_parts["label"].value =\
+        f'{place}, {properties.get("stusps")},\
+        {radio_button_dict[result["map_color"]]}: {value}'
+
+    @reactive.Effect
+    def playback():
+        result = playback_view()
+        if result is None:
+            hide_playback_layers()
+            map_parts["hover"] = None
+            playback_state["result"] = None
+            return
+        region_grain = result["grain"]
+        frame = min(input.frame(), len(result["months"]) - 1)
+        with metrics.render("playback", metric=result["map_color"], grain=region_grain,
+                            window=result["window"], frame=frame):
+            playback_state.update(result=result, frame=frame)
+            bins, rgb_list = result["bins"][frame], result["rgb_list"]
+            if len(result["keys"]) <= playback_layer_max:
+                # layers are made once per grain, then only restyled
+                if region_grain not in playback_parts:
+                    with metrics.stage("playback_layers"):
+                        playback_parts[region_grain] = sf.create_playback_layers(
+                            sf.parse_geometry(grains[region_grain]["geometry"]),
+                            playback_hover)
+                parts = playback_parts[region_grain]
+                # choropleth colors would show through the frame colors
+                if playback_state["layers"] is not parts:
+                    hide_playback_layers()
+                    basemap = map_parts["map"]
+                    if map_parts["choro_layer"] in basemap.layers:
+                        basemap.remove_layer(map_parts["choro_layer"])
+                    basemap.add_layer(parts["group"])
+                    playback_state["layers"] = parts
+                # send only regions whose color changed
+                with metrics.stage("set_frame"):
+                    sf.set_playback_frame(parts, bins, rgb_list)
+            else:
+                # a layer per county would be thousands of widgets, so
+                # frames recolor the choropleth in one message
+                hide_playback_layers()
+                show_choro(region_grain)
+                map_parts["hover"] = playback_hover
+                with metrics.stage("set_frame"):
+                    sf.set_choro_classes(map_parts, bins, rgb_list)
+
+            # legend only changes with metric, window or scheme
+            legend = map_parts["legend"]
+            legends = cf.legend_labels(result["breaks"], rgb_list)
+            if legend.legends != legends:
+                legend.legends = legends
+                legend.name = f'{radio_button_dict[result["map_color"]]} ' \
+                    f'({playback_window_dict[str(result["window"])]})'
+            map_parts["label"].value = f'Month: {str(result["months"][frame])[:7]}'
+
+# prometheus text metrics, stages are empty unless APP_METRICS is set
+def metrics_endpoint(request):
+    return PlainTextResponse(metrics.prometheus_text(cache_stats()),
+                             media_type="text/plain; version=0.0.4")
+
+# region sums and rates for date range and metric as JSON or CSV
+# e.g. /api/rates?start=2021-01-01&end=2022-01-01&metric=killed_per_100k&format=csv
+async def export_endpoint(request):
+    try:
+        key = export_query(request.query_params)
+    except ValueError as error:
+        return PlainTextResponse(str(error), status_code=400)
+    etag = export_etag(*key)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={export_max_age}",
+               "Vary": "Accept-Encoding"}
+    # unchanged, answer before touching the data
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in \
+            [tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    body = await asyncio.wrap_future(export_executor.submit(export_body, *key))
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = gzip.decompress(body)
+    return Response(body, media_type=export_media_dict[key[-1]], headers=headers)
+
+shiny_app = App(app_ui, server)
+app = Starlette(routes=[Route("/metrics", metrics_endpoint),
+                        Route("/api/rates", export_endpoint),
+                        Mount("/", app=shiny_app)])
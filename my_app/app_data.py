@@ -0,0 +1,240 @@
+#!/usr/bin/env/ python
+# data the app serves, loaded from tables or shared between workers
+# set APP_SHARED_DATA=<dir> so workers attach to one published copy
+# build the runtime bundle before deploying, the app then starts
+# without reading tables or shapes:
+#   python app_data.py --runtime
+# import packages
+import os
+import sys
+import json
+import argparse
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+# import functions
+import shiny_functions as sf
+import geometry_functions as gf
+import data_store as ds
+
+# logger for bundles that don't match the tables
+logger = logging.getLogger("app.data")
+
+# value columns summed for the map
+VALUE_LIST = ["count","#_injured","#_killed","total_injured_killed"]
+# bundle name prefix
+BUNDLE = "app_data"
+# bump when the bundle layout changes so old bundles are rebuilt
+BUNDLE_VERSION = 2
+# prebuilt bundle shipped with the app in data/
+RUNTIME_BUNDLE = "runtime"
+# branca palette for each map metric
+PALETTES = {"count_per_1k": "Blues_07", "injured_per_1k": "Greens_07",
+            "killed_per_1k": "Reds_07"}
+
+# function to create legend color tables
+def legend_colors(palettes=PALETTES):
+    """
+    Pass dict of metric -> branca palette name.
+    Returns dict of metric -> hex colors
+    """
+    from branca.colormap import linear
+    return {metric: sf.rgb_to_hex(getattr(linear, palette).colors)
+            for (metric, palette) in palettes.items()}
+
+# function to load app data from tables
+def load_app_data(path="data"):
+    """
+    Pass data directory.
+    Builds the cumulative cube, serialized geometry and properties
+    cache for every grain.
+    Returns dict of grains, gun laws, start/end dates and data version
+    """
+    df = ds.load_table('df_yr_mon_state', path)
+    # simplified shapes for map max zoom
+    us_shp = gf.load_level(path, gf.pick_level(zoom=6))
+    df_census = ds.load_table('df_us_census', path)
+    # serialize state geometry once keyed by state_fips
+    geometry_cache = sf.build_geometry_cache(us_shp.merge(df_census[["state","state_fips"]],
+        left_on="name", right_on="state").drop(columns="state"), "state_fips")
+    grains = {"state": {"cube": sf.build_cumulative_cube(df, VALUE_LIST),
+                        "census": df_census, "key": "state_fips",
+                        "geometry_cache": geometry_cache}}
+
+    # county mode, only when county aggregates, population and shapes are built
+    county_level = f"us_county_{gf.pick_level(zoom=6)}"
+    if all(ds.table_exists(name, path) for name in
+           ('df_yr_mon_county', 'df_us_census_county', county_level)):
+        df_county = ds.load_table('df_yr_mon_county', path)
+        us_county = gf.load_level(path, gf.pick_level(zoom=6), name="us_county")
+        grains["county"] = {
+            "cube": sf.build_cumulative_cube(df_county, VALUE_LIST, region_col="county_fips"),
+            "census": ds.load_table('df_us_census_county', path),
+            "key": "county_fips",
+            "geometry_cache": sf.build_geometry_cache(us_county, "county_fips")}
+    for data in grains.values():
+        data["geometry"], data["geometry_cache"] = \
+            sf.serialize_geometry(data["geometry_cache"])
+    return add_keys({"grains": grains,
+                     "df_gun_laws": ds.load_table('df_gun_laws', path),
+                     "start_date": pd.Timestamp(min(df["date"])).date(),
+                     "end_date": pd.Timestamp(max(df["date"])).date(),
+                     "legend_colors": legend_colors(),
+                     "data_version": data_version(path)})
+
+# function to add region keys
+def add_keys(app_data):
+    """
+    Pass app data.
+    Adds region keys per grain in the order of the serialized geometry.
+    Returns app data
+    """
+    for data in app_data["grains"].values():
+        data["keys"] = list(data["geometry_cache"])
+    return app_data
+
+# function to get version of source tables
+def data_version(path="data"):
+    """
+    Pass data directory.
+    Hashes the content of its files (and table part directories),
+    so copying the data on deploy keeps the version.
+    Returns short hash, None when there are no tables
+    """
+    sha = hashlib.sha256()
+    files = 0
+    for (root, dirs, names) in os.walk(path):
+        # published bundles aren't source data
+        dirs[:] = sorted(name for name in dirs if ".shared" not in name)
+        for name in sorted(names):
+            file = os.path.join(root, name)
+            sha.update(os.path.relpath(file, path).encode())
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+            files += 1
+    return sha.hexdigest()[:12] if files else None
+
+# function to publish app data
+def publish_app_data(app_data, name, path):
+    """
+    Pass app data, bundle name and shared directory.
+    Cubes and serialized geometry are written as arrays, properties
+    as GeoJSON bytes and the small census/gun law tables as parquet.
+    Returns bundle directory
+    """
+    arrays = {}
+    tables = {"df_gun_laws": app_data["df_gun_laws"]}
+    meta = {"start_date": str(app_data["start_date"]),
+            "end_date": str(app_data["end_date"]),
+            "legend_colors": app_data["legend_colors"],
+            "data_version": app_data["data_version"],
+            "version": BUNDLE_VERSION, "grains": {}}
+    for (grain, data) in app_data["grains"].items():
+        cube = data["cube"]
+        arrays[f"{grain}_months"] = cube["months"]
+        arrays[f"{grain}_regions"] = cube["regions"]
+        arrays[f"{grain}_cube"] = cube["cube"]
+        arrays[f"{grain}_geometry"] = data["geometry"]
+        arrays[f"{grain}_properties"] = np.frombuffer(
+            json.dumps(data["geometry_cache"]).encode(), dtype=np.uint8)
+        tables[f"census_{grain}"] = data["census"]
+        meta["grains"][grain] = {"key": data["key"], "value_list": cube["value_list"],
+                                 "region_col": cube["region_col"]}
+    return ds.publish_arrays(arrays, name, path, meta, tables)
+
+# function to attach to published app data
+def attach_app_data(name, path):
+    """
+    Pass bundle name and shared directory.
+    Cubes and serialized geometry stay memory mapped so workers share
+    one copy, geometry is parsed per map layer by
+    shiny_functions.parse_geometry. Only properties are parsed here.
+    Returns dict in the same layout as load_app_data
+    """
+    arrays, meta = ds.attach_arrays(name, path)
+    bundle = os.path.join(path, f"{name}.shared")
+    grains = {}
+    for (grain, info) in meta["grains"].items():
+        grains[grain] = {
+            "cube": {"months": arrays[f"{grain}_months"],
+                     "regions": arrays[f"{grain}_regions"],
+                     "value_list": info["value_list"],
+                     "region_col": info["region_col"],
+                     "cube": arrays[f"{grain}_cube"]},
+            "census": ds.load_table(f"census_{grain}", bundle),
+            "key": info["key"],
+            "geometry": arrays[f"{grain}_geometry"],
+            "geometry_cache": json.loads(arrays[f"{grain}_properties"].tobytes())}
+    return add_keys({"grains": grains,
+                     "df_gun_laws": ds.load_table("df_gun_laws", bundle),
+                     "start_date": pd.Timestamp(meta["start_date"]).date(),
+                     "end_date": pd.Timestamp(meta["end_date"]).date(),
+                     "legend_colors": meta["legend_colors"],
+                     # bundles published before versions were kept
+                     "data_version": meta.get("data_version", name)})
+
+# function to get app data
+def get_app_data(path="data", shared_path=None):
+    """
+    Pass data directory and optional shared directory.
+    The runtime bundle in the data directory is used when built
+    from the tables beside it (or shipped without them), otherwise
+    without shared_path every process loads its own copy.
+    With it, the first worker publishes a bundle for the current
+    data version and every worker attaches to it.
+    Returns app data dict
+    """
+    version = data_version(path)
+    if ds.arrays_exist(RUNTIME_BUNDLE, path):
+        meta = ds.attach_arrays(RUNTIME_BUNDLE, path)[1]
+        if meta.get("version") != BUNDLE_VERSION:
+            logger.warning("Runtime bundle layout is out of date, loading tables, "
+                           "rebuild with: python app_data.py --runtime")
+        elif version is not None and meta.get("data_version") != version:
+            # e.g. ingest_data.py updated the tables after the bundle was built
+            logger.warning("Runtime bundle was built from other data (%s, tables are %s), "
+                           "loading tables, rebuild with: python app_data.py --runtime",
+                           meta.get("data_version"), version)
+        else:
+            return attach_app_data(RUNTIME_BUNDLE, path)
+    if shared_path is None:
+        return load_app_data(path)
+    name = f"{BUNDLE}-{BUNDLE_VERSION}-{version}"
+    if not ds.arrays_exist(name, shared_path):
+        publish_app_data(load_app_data(path), name, shared_path)
+    return attach_app_data(name, shared_path)
+
+# function to build runtime bundle
+def build_runtime(path="data"):
+    """
+    Pass data directory.
+    Rebuilds data/runtime.shared from the tables, run after data changes.
+    Returns bundle directory
+    """
+    import shutil
+    bundle = os.path.join(path, f"{RUNTIME_BUNDLE}.shared")
+    app_data = load_app_data(path)
+    if os.path.exists(bundle):
+        shutil.rmtree(bundle)
+    return publish_app_data(app_data, RUNTIME_BUNDLE, path)
+
+# function to run from command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or publish app data")
+    parser.add_argument("--data", default="data", help="app data directory")
+    parser.add_argument("--runtime", action="store_true",
+                        help="build runtime bundle shipped with the app")
+    parser.add_argument("--shared", default=None,
+                        help="publish to shared directory before starting workers")
+    args = parser.parse_args(argv)
+    if args.runtime:
+        print(f"Built {build_runtime(args.data)}")
+    if args.shared:
+        get_app_data(args.data, args.shared)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+#!/usr/bin/env/ python
+# import packages
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+# compact dtypes for each table, columns not listed keep their dtype
+TABLE_DTYPES = {
+    "df_gun_violence": {"incident_id": "int64", "state": "category",
+                        "city_or_county": "category", "address": "string",
+                        "#_killed": "int16", "#_injured": "int16"},
+    "df_gun": {"incident_id": "int64", "state": "category",
+               "city_or_county": "category", "address": "string",
+               "#_killed": "int16", "#_injured": "int16",
+               "day": "int8", "month": "int8", "monthname": "category",
+               "monthtype": "category", "year": "int16", "dayofweek": "int8",
+               "dayname": "category", "daytype": "category"},
+    "df_yr_mon_state": {"year": "int16", "monthname": "category",
+                        "state": "category", "#_injured": "int32",
+                        "#_killed": "int32", "total_injured_killed": "int32",
+                        "count": "int32", "month": "int8",
+                        "date": "datetime64[ns]"},
+    "df_gun_laws": {"lawtotal": "int16"},
+}
+
+# states left out of monthly aggregates, map rates, exports and the
+# gun law analysis, same as app workflow notebook
+EXCLUDE_STATES = ["District of Columbia"]
+
+# date column each table is sorted by so row groups can be skipped
+TABLE_SORT = {"df_gun_violence": "incident_date", "df_gun": "incident_date",
+              "df_yr_mon_state": "date"}
+
+# general function for cleaning columns
+def clean_cols(df):
+    df.columns = [x.lower().replace(" ","_") for x in df.columns]
+    return df
+
+# function to set compact dtypes
+def compact_dtypes(df, name):
+    """
+    Pass df and table name.
+    Casts columns listed in TABLE_DTYPES for that table.
+    Returns new df
+    """
+    dtypes = {col: dtype for (col, dtype) in TABLE_DTYPES.get(name, {}).items()
+              if col in df.columns}
+    return df.astype(dtypes)
+
+# function to save table
+def save_table(df, name, path, fmt="parquet", row_group_size=100_000):
+    """
+    Pass df, table name and directory.
+    Writes <name>.parquet (GeoParquet for GeoDataFrames) or
+    <name>.feather with compact dtypes, sorted by date so
+    row groups can be filtered on load
+    """
+    os.makedirs(path, exist_ok=True)
+    file = os.path.join(path, f"{name}.{fmt}")
+    # geometry tables are written as is
+    if hasattr(df, "set_geometry"):
+        df.to_parquet(file, index=False)
+        return file
+    df = compact_dtypes(df, name)
+    if TABLE_SORT.get(name) in df.columns:
+        df = df.sort_values(TABLE_SORT[name])
+    df = df.reset_index(drop=True)
+    if fmt == "feather":
+        df.to_feather(file)
+    else:
+        df.to_parquet(file, index=False, row_group_size=row_group_size)
+    return file
+
+# function to append rows to table
+def append_table(df, name, path, part):
+    """
+    Pass df, table name, directory and part name.
+    Table is stored as a Parquet dataset directory <name>.parquet
+    with one file per part, so appending never rewrites old rows.
+    Writing the same part again replaces it.
+    Returns part file
+    """
+    table_path = os.path.join(path, f"{name}.parquet")
+    # single file table becomes the first part
+    if os.path.isfile(table_path):
+        os.rename(table_path, table_path + ".tmp")
+        os.makedirs(table_path)
+        os.rename(table_path + ".tmp", os.path.join(table_path, "part-0.parquet"))
+    os.makedirs(table_path, exist_ok=True)
+    df = compact_dtypes(df, name)
+    if TABLE_SORT.get(name) in df.columns:
+        df = df.sort_values(TABLE_SORT[name])
+    part_file = os.path.join(table_path, f"part-{part}.parquet")
+    df.to_parquet(part_file, index=False)
+    return part_file
+
+# function to remove parts from table
+def remove_parts(name, path, prefix):
+    """
+    Pass table name, directory and part name prefix.
+    Removes parts left by an unfinished write
+    """
+    table_path = os.path.join(path, f"{name}.parquet")
+    if not os.path.isdir(table_path):
+        return
+    for part in os.listdir(table_path):
+        if part.startswith(f"part-{prefix}"):
+            os.remove(os.path.join(table_path, part))
+
+# function to create row filters
+def table_filters(start=None, end=None, states=None, date_col="date",
+                  state_col="state"):
+    """
+    Pass optional start/end dates and list of states.
+    Date range is start <= date < end, same as the app.
+    Returns filters list for load_table
+    """
+    filters = []
+    if start is not None:
+        filters.append((date_col, ">=", pd.Timestamp(start)))
+    if end is not None:
+        filters.append((date_col, "<", pd.Timestamp(end)))
+    if states is not None:
+        filters.append((state_col, "in", list(states)))
+    return filters or None
+
+# function to check table exists
+def table_exists(name, path):
+    """
+    Pass table name and directory.
+    Returns True if stored as parquet, feather or pickle
+    """
+    file = os.path.join(path, name)
+    return any(os.path.exists(file + ext) for ext in (".parquet", ".feather", ""))
+
+# function to get schema of all parts
+def dataset_schema(table_path):
+    """
+    Pass <name>.parquet file or dataset directory.
+    Parts appended over time may lack newer columns, which would be
+    dropped when the first part read is an old one.
+    Returns schema with the columns of every part, None for a file
+    """
+    if not os.path.isdir(table_path):
+        return None
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    parts = sorted(os.path.join(table_path, part) for part in os.listdir(table_path)
+                   if part.endswith(".parquet"))
+    if not parts:
+        return None
+    # pandas metadata is taken from the part with the most columns
+    schemas = sorted((pq.read_schema(part) for part in parts), key=len, reverse=True)
+    # category index width depends on each part's categories, read all as int32
+    schemas = [pa.schema([field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                          if pa.types.is_dictionary(field.type) else field
+                          for field in schema], metadata=schema.metadata)
+               for schema in schemas]
+    return pa.unify_schemas(schemas)
+
+# function to load table
+def load_table(name, path, columns=None, filters=None, geo=False):
+    """
+    Pass table name and directory.
+    Reads <name>.parquet, <name>.feather or falls back to the old
+    pickle <name>. columns only reads those columns, filters
+    (see table_filters) skips row groups outside the range.
+    Columns missing from older parts are read as null.
+    geo=True returns GeoDataFrame.
+    Returns df
+    """
+    file = os.path.join(path, name)
+    if os.path.exists(file + ".parquet"):
+        if geo:
+            import geopandas as gpd
+            return gpd.read_parquet(file + ".parquet", columns=columns)
+        return pd.read_parquet(file + ".parquet", columns=columns,
+                               filters=filters, memory_map=True,
+                               schema=dataset_schema(file + ".parquet"))
+    if os.path.exists(file + ".feather"):
+        df = pd.read_feather(file + ".feather", columns=columns)
+    else:
+        df = pd.read_pickle(file)
+        if columns is not None:
+            df = df[columns]
+        if geo:
+            import geopandas as gpd
+            return gpd.GeoDataFrame(df)
+    # feather and pickle can't skip rows, filter after load
+    for (col, op, value) in filters or []:
+        if op == "in":
+            df = df[df[col].isin(value)]
+        elif op == ">=":
+            df = df[pd.to_datetime(df[col]) >= value]
+        elif op == "<":
+            df = df[pd.to_datetime(df[col]) < value]
+    return df.reset_index(drop=True) if filters else df
+
+# function to read table in batches
+def iter_table(name, path, columns=None, filters=None, batch_size=100_000):
+    """
+    Pass table name and directory, optional columns and filters
+    (see table_filters).
+    Parquet tables are scanned batch_size rows at a time, so memory
+    stays at one batch however large the table is. Feather and
+    pickle tables are loaded whole and then split.
+    Yields dfs
+    """
+    file = os.path.join(path, name) + ".parquet"
+    if not os.path.exists(file):
+        df = load_table(name, path, columns, filters)
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start + batch_size].reset_index(drop=True)
+        return
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as pads
+    ops = {">=": lambda field, value: field >= pa.scalar(value),
+           "<": lambda field, value: field < pa.scalar(value),
+           "in": lambda field, value: field.isin(list(value))}
+    expression = None
+    for (col, op, value) in filters or []:
+        condition = ops[op](pc.field(col), value)
+        expression = condition if expression is None else expression & condition
+    dataset = pads.dataset(file, schema=dataset_schema(file), format="parquet")
+    for batch in dataset.to_batches(columns=columns, filter=expression,
+                                    batch_size=batch_size):
+        if batch.num_rows:
+            yield pa.Table.from_batches([batch]).to_pandas()
+
+# function to publish arrays for other processes
+def publish_arrays(arrays, name, path, meta=None, tables=None):
+    """
+    Pass dict of numpy arrays, bundle name and directory.
+    Writes <name>.shared/ with one .npy per array, meta.json and
+    optional dict of small tables saved with save_table.
+    The directory is swapped in whole, so readers never see half a
+    bundle, and if another process published first theirs is kept.
+    Returns bundle directory
+    """
+    bundle = os.path.join(path, f"{name}.shared")
+    tmp = f"{bundle}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    for (key, array) in arrays.items():
+        array = np.asarray(array)
+        # object arrays can't be memory mapped
+        if array.dtype == object:
+            array = array.astype(str)
+        np.save(os.path.join(tmp, f"{key}.npy"), array, allow_pickle=False)
+    for (key, df) in (tables or {}).items():
+        save_table(df, key, tmp)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"arrays": list(arrays), "meta": meta or {}}, f)
+    try:
+        os.rename(tmp, bundle)
+    except OSError:
+        shutil.rmtree(tmp)
+    return bundle
+
+# function to check published arrays exist
+def arrays_exist(name, path):
+    """
+    Pass bundle name and directory.
+    Returns True if published with publish_arrays
+    """
+    return os.path.exists(os.path.join(path, f"{name}.shared", "meta.json"))
+
+# function to attach to published arrays
+def attach_arrays(name, path):
+    """
+    Pass bundle name and directory.
+    Arrays are memory mapped read only, so every process attached
+    shares the same pages of the OS page cache. Tables are read
+    with load_table(key, <name>.shared).
+    Returns dict of arrays and meta dict
+    """
+    bundle = os.path.join(path, f"{name}.shared")
+    with open(os.path.join(bundle, "meta.json")) as f:
+        info = json.load(f)
+    arrays = {key: np.load(os.path.join(bundle, f"{key}.npy"), mmap_mode="r",
+                           allow_pickle=False)
+              for key in info["arrays"]}
+    return arrays, info["meta"]
+
+# function to convert pickles to parquet
+def convert_pickles(pickle_path, path, fmt="parquet"):
+    """
+    Pass pickle directory and output directory.
+    Writes every pickle in pickle_path with save_table
+    """
+    for name in sorted(os.listdir(pickle_path)):
+        file = os.path.join(pickle_path, name)
+        if os.path.isfile(file) and "." not in name:
+            save_table(pd.read_pickle(file), name, path, fmt=fmt)
+
+if __name__ == "__main__":
+    # convert notebook and app pickles
+    convert_pickles("./data/pickle", "./data/parquet")
+    convert_pickles("./my_app/data", "./my_app/data")
@@ -0,0 +1,233 @@
+#!/usr/bin/env/ python
+# import packages
+import os
+import pandas as pd
+import data_store as ds
+
+# simplification levels, tolerance in degrees (crs 4326)
+# 0 keeps full detail census boundaries
+SIMPLIFY_LEVELS = {"full": 0, "high": 0.002, "medium": 0.01, "low": 0.05}
+
+# continental us width in degrees, used for static maps
+US_EXTENT = 60
+
+# census county boundaries, same vintage as state shapes
+COUNTY_SHP_URL = "https://www2.census.gov/geo/tiger/GENZ2021/shp/cb_2021_us_county_500k.zip"
+# territory state fips left out, same as state shapes
+DROP_STATEFP = ["60", "66", "69", "72", "78"]
+# county name suffixes in GVA city_or_county
+COUNTY_SUFFIXES = r"\s+(?:county|parish|borough|census area|municipality)$"
+# place type suffixes dropped by place_key, county suffixes are kept
+# so a county and its namesake city (Baltimore County, Baltimore
+# city) get different keys
+PLACE_SUFFIXES = r"(?:\s+(?:city|town|village|cdp|township))+$"
+
+# function to simplify shapes keeping shared borders
+def simplify_shapes(gdf, tolerance, grid_size=None):
+    """
+    Pass GeoDataFrame and tolerance in crs units.
+    Shared borders are simplified once so neighbours stay joined
+    (shapely >= 2.1), otherwise each shape keeps its own topology.
+    Optional grid_size snaps coordinates to grid (quantize).
+    Returns new GeoDataFrame
+    """
+    import shapely
+    gdf = gdf.copy()
+    if tolerance > 0:
+        if hasattr(shapely, "coverage_simplify"):
+            geoms = shapely.coverage_simplify(gdf.geometry.values, tolerance)
+            gdf = gdf.set_geometry(list(geoms), crs=gdf.crs)
+        else:
+            gdf["geometry"] = gdf.geometry.simplify(tolerance,
+                                                    preserve_topology=True)
+    if grid_size:
+        geoms = shapely.set_precision(gdf.geometry.values, grid_size)
+        gdf = gdf.set_geometry(list(geoms), crs=gdf.crs)
+    return gdf
+
+# function to build all simplified levels
+def build_levels(gdf, levels=SIMPLIFY_LEVELS, grid_size=None):
+    """
+    Pass GeoDataFrame and dict of level name -> tolerance.
+    Returns dict of level name -> simplified GeoDataFrame
+    """
+    return {level: simplify_shapes(gdf, tolerance, grid_size)
+            for (level, tolerance) in levels.items()}
+
+# function to save simplified levels
+def save_levels(shp_levels, path, name="us_shp", topojson=False,
+                quantization=1e5):
+    """
+    Pass dict of level GeoDataFrames, directory and base name.
+    Writes each level as GeoParquet <name>_<level>.parquet.
+    topojson=True also writes quantized <name>_<level>.topojson
+    (needs topojson package)
+    """
+    for (level, gdf) in shp_levels.items():
+        ds.save_table(gdf, f"{name}_{level}", path)
+        if topojson:
+            try:
+                import topojson as tp
+            except ImportError:
+                raise ImportError("topojson=True needs the topojson package")
+            topo = tp.Topology(gdf, prequantize=quantization)
+            topo.to_json(os.path.join(path, f"{name}_{level}.topojson"))
+
+# function to load one simplified level
+def load_level(path, level, name="us_shp"):
+    """
+    Pass directory and level name.
+    Returns level as GeoDataFrame
+    """
+    return ds.load_table(f"{name}_{level}", path, geo=True)
+
+# function to get degrees covered by a pixel
+def degrees_per_pixel(zoom=None, width_px=None, extent=US_EXTENT):
+    """
+    Pass web map zoom or output width in pixels.
+    Zoom uses 256px tiles, width spreads extent over width_px.
+    Returns degrees per pixel
+    """
+    if zoom is not None:
+        return 360 / (256 * 2 ** zoom)
+    if width_px:
+        return extent / width_px
+    raise ValueError("Pass zoom or width_px")
+
+# function to pick simplified level
+def pick_level(zoom=None, width_px=None, levels=SIMPLIFY_LEVELS,
+               extent=US_EXTENT):
+    """
+    Pass web map zoom or output width in pixels.
+    Picks coarsest level whose tolerance fits in one pixel,
+    so simplification can't be seen.
+    Returns level name
+    """
+    max_tolerance = degrees_per_pixel(zoom, width_px, extent)
+    usable = {level: tolerance for (level, tolerance) in levels.items()
+              if tolerance <= max_tolerance}
+    if not usable:
+        return min(levels, key=levels.get)
+    return max(usable, key=usable.get)
+
+# function to swap in simplified geometry
+def apply_level(df, level_gdf, key="state", level_key="name"):
+    """
+    Pass GeoDataFrame and simplified level GeoDataFrame.
+    Replaces df geometry by joining key to level_key.
+    Returns new GeoDataFrame
+    """
+    import geopandas as gpd
+    geometry = level_gdf.set_index(level_key).geometry
+    df = pd.DataFrame(df.copy())
+    df["geometry"] = df[key].map(geometry)
+    return gpd.GeoDataFrame(df, geometry="geometry", crs=level_gdf.crs)
+
+# function to load county shapes
+def load_county_shapes(url=COUNTY_SHP_URL):
+    """
+    Pass county shapefile url or path.
+    Cleans columns, sets crs 4326 and drops territories.
+    county_fips is the 5 digit geoid.
+    Returns GeoDataFrame of ~3,200 counties
+    """
+    import geopandas as gpd
+    counties = gpd.read_file(url)
+    counties.columns = [x.lower() for x in counties.columns]
+    counties = counties.to_crs(4326)
+    counties = counties[~counties["statefp"].isin(DROP_STATEFP)]
+    counties = counties.rename(columns={"geoid": "county_fips"})
+    return counties.reset_index(drop=True)
+
+# function to assign points to counties
+def assign_counties(df, counties, lon_col="longitude", lat_col="latitude"):
+    """
+    Pass df with lon/lat cols and county GeoDataFrame.
+    All points are matched in one bulk query of an STRtree of the
+    county shapes, no row by row lookups.
+    Returns series of county_fips (NaN where no match)
+    """
+    import numpy as np
+    import shapely
+    has_point = (df[lon_col].notna() & df[lat_col].notna()).to_numpy()
+    county_fips = np.full(len(df), None, dtype=object)
+    if has_point.any():
+        points = shapely.points(df[lon_col].to_numpy()[has_point],
+                                df[lat_col].to_numpy()[has_point])
+        tree = shapely.STRtree(counties.geometry.values)
+        point_idx, county_idx = tree.query(points, predicate="intersects")
+        # points on a border match twice, keep first
+        point_idx, first = np.unique(point_idx, return_index=True)
+        rows = np.flatnonzero(has_point)[point_idx]
+        county_fips[rows] = counties["county_fips"].to_numpy()[county_idx[first]]
+    return pd.Series(county_fips, index=df.index, name="county_fips")
+
+# function to normalize place names
+def place_key(names):
+    """
+    Pass series of place names.
+    Lower cases, turns St./Ste. into saint/sainte, drops "(...)",
+    city/town suffixes, punctuation and repeated spaces. Used for
+    county names and gazetteer keys alike.
+    Returns series of keys
+    """
+    return names.astype("string").str.lower()\
+    .str.replace(r"^st\.?\s", "saint ", regex=True)\
+    .str.replace(r"^ste\.?\s", "sainte ", regex=True)\
+    .str.replace(r"\s*\(.*\)", "", regex=True)\
+    .str.replace(PLACE_SUFFIXES, "", regex=True)\
+    .str.replace(r"[^a-z0-9 ]", "", regex=True)\
+    .str.replace(r"\s+", " ", regex=True).str.strip()
+
+# function to match county names
+def match_county_names(df, counties, state_col="state",
+                       place_col="city_or_county"):
+    """
+    Pass incident df and county GeoDataFrame.
+    Matches rows whose city_or_county names a county
+    (e.g. "Cook County") to the county's full name (namelsad, e.g.
+    "Cook County", "Baltimore city") within the same state as one
+    merge. Raises ValueError if two counties of a state get one key.
+    Returns series of county_fips (NaN where no match)
+    """
+    is_county = df[place_col].astype("string").str.contains(COUNTY_SUFFIXES,
+        case=False, regex=True).fillna(False)
+    keys = pd.DataFrame({"state_name": df[state_col].astype("string"),
+                         "key": place_key(df[place_col])})
+    keys.loc[~is_county.to_numpy(), "key"] = pd.NA
+    county_keys = pd.DataFrame({"state_name": counties["state_name"].astype("string"),
+                                "key": place_key(counties["namelsad"]),
+                                "county_fips": counties["county_fips"]})
+    duplicated = county_keys.duplicated(["state_name", "key"], keep=False)
+    if duplicated.any():
+        raise ValueError("counties with the same name key: " +
+                         ", ".join(counties["county_fips"][duplicated.to_numpy()]))
+    matched = keys.merge(county_keys, how="left", on=["state_name", "key"])
+    return pd.Series(matched["county_fips"].to_numpy(), index=df.index,
+                     name="county_fips")
+
+# function to find county of each incident
+def incident_counties(df, counties, lon_col="longitude", lat_col="latitude"):
+    """
+    Pass incident df and county GeoDataFrame.
+    Rows naming a county use the county name match, a geocoded
+    point of those may be the namesake city's. The spatial join
+    is used for the rest where the row has coordinates.
+    Returns series of county_fips
+    """
+    county_fips = match_county_names(df, counties)
+    if lon_col in df.columns and lat_col in df.columns:
+        spatial = assign_counties(df, counties, lon_col, lat_col)
+        county_fips = county_fips.fillna(spatial)
+    return county_fips
+
+if __name__ == "__main__":
+    # build simplified levels for notebooks and app
+    us_shp = ds.load_table("us_shp", "./data/pickle", geo=True)
+    shp_levels = build_levels(us_shp)
+    save_levels(shp_levels, "./data/parquet")
+    save_levels(shp_levels, "./my_app/data")
+    # county levels for county mode
+    county_levels = build_levels(load_county_shapes())
+    save_levels(county_levels, "./data/parquet", name="us_county")
+    save_levels(county_levels, "./my_app/data", name="us_county")
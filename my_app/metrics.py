@@ -0,0 +1,169 @@
+#!/usr/bin/env/ python
+# per stage timing for map renders
+# switch on with APP_METRICS=1, APP_METRICS=alloc also traces allocations
+# allocation peaks are per process and only kept for stages with no
+# stage inside, stages running at once in other threads add to them
+# import packages
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+import tracemalloc
+
+# logger for one structured line per render
+logger = logging.getLogger("app.metrics")
+
+# on/off switches
+ENABLED = os.environ.get("APP_METRICS", "") not in ("", "0")
+TRACE_ALLOC = os.environ.get("APP_METRICS", "") == "alloc"
+
+# totals per stage: count, seconds, max seconds, max alloc bytes (None
+# when never recorded)
+_totals = {}
+_lock = threading.Lock()
+# stages of the render running in this thread
+_local = threading.local()
+# returned when off so a stage costs one check
+_null = contextlib.nullcontext()
+
+# function to send render lines to stderr
+def _log_to_stderr():
+    """
+    The root logger only shows warnings, so render lines get their
+    own handler at INFO level
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+# function to switch metrics on or off
+def set_enabled(enabled, trace_alloc=False):
+    """
+    Pass True/False, trace_alloc also records allocation peaks
+    """
+    global ENABLED, TRACE_ALLOC
+    ENABLED, TRACE_ALLOC = enabled, enabled and trace_alloc
+    if ENABLED:
+        _log_to_stderr()
+    if TRACE_ALLOC and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not TRACE_ALLOC and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+# function to add stage timing to totals
+def _record(name, seconds, alloc):
+    with _lock:
+        total = _totals.setdefault(name, {"count": 0, "seconds": 0.0,
+                                          "max_seconds": 0.0, "max_alloc": None})
+        total["count"] += 1
+        total["seconds"] += seconds
+        total["max_seconds"] = max(total["max_seconds"], seconds)
+        if alloc is not None:
+            total["max_alloc"] = max(total["max_alloc"] or 0, alloc)
+    stages = getattr(_local, "stages", None)
+    if stages is not None:
+        stages[name] = {"ms": round(seconds * 1000, 3)}
+        if alloc is not None:
+            stages[name]["alloc_bytes"] = alloc
+
+@contextlib.contextmanager
+def _timed(name):
+    # open stages of this thread, an inner stage resets the peak so
+    # the outer stage's peak is no longer known
+    open_stages = _local.__dict__.setdefault("open_stages", [])
+    if open_stages:
+        open_stages[-1]["nested"] = True
+    frame = {"nested": False}
+    open_stages.append(frame)
+    if TRACE_ALLOC:
+        tracemalloc.reset_peak()
+        alloc_start = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        open_stages.pop()
+        alloc = tracemalloc.get_traced_memory()[1] - alloc_start \
+            if TRACE_ALLOC and not frame["nested"] else None
+        _record(name, seconds, alloc)
+
+# function to time a stage
+def stage(name):
+    """
+    Pass stage name, use as `with stage("merge"):`
+    Records wall time (and allocation peak when no stage runs
+    inside it) when metrics are on
+    """
+    if not ENABLED:
+        return _null
+    return _timed(name)
+
+@contextlib.contextmanager
+def _timed_render(name, info):
+    _local.stages = {}
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        stages, _local.stages = _local.stages, None
+        _record(name, seconds, None)
+        logger.info(json.dumps({"render": name, "ms": round(seconds * 1000, 3),
+                                "stages": stages, **info}))
+
+# function to time a whole render
+def render(name, **info):
+    """
+    Pass render name and extra info to log.
+    Stages inside are logged together as one json line
+    """
+    if not ENABLED:
+        return _null
+    return _timed_render(name, info)
+
+# function to create prometheus text
+def prometheus_text(cache_stats=None):
+    """
+    Pass optional dict of cache name -> cache_info dict.
+    Returns metrics in Prometheus text format
+    """
+    with _lock:
+        totals = {name: dict(total) for (name, total) in _totals.items()}
+    lines = ["# HELP app_stage_seconds Wall time of map render stages",
+             "# TYPE app_stage_seconds summary"]
+    for (name, total) in sorted(totals.items()):
+        lines.append(f'app_stage_seconds_count{{stage="{name}"}} {total["count"]}')
+        lines.append(f'app_stage_seconds_sum{{stage="{name}"}} {total["seconds"]:.6f}')
+    lines += ["# HELP app_stage_seconds_max Slowest run of each stage",
+              "# TYPE app_stage_seconds_max gauge"]
+    for (name, total) in sorted(totals.items()):
+        lines.append(f'app_stage_seconds_max{{stage="{name}"}} {total["max_seconds"]:.6f}')
+    if TRACE_ALLOC:
+        lines += ["# HELP app_stage_alloc_bytes_max Largest allocation peak of each stage",
+                  "# TYPE app_stage_alloc_bytes_max gauge"]
+        # stages with stages inside have no peak of their own
+        for (name, total) in sorted(totals.items()):
+            if total["max_alloc"] is not None:
+                lines.append(f'app_stage_alloc_bytes_max{{stage="{name}"}} {total["max_alloc"]}')
+    if cache_stats:
+        for key in ("hits", "misses", "currsize"):
+            metric = f"app_cache_{key}" + ("_total" if key != "currsize" else "")
+            lines.append(f"# TYPE {metric} {'counter' if key != 'currsize' else 'gauge'}")
+            for (cache, info) in sorted(cache_stats.items()):
+                lines.append(f'{metric}{{cache="{cache}"}} {info[key]}')
+    return "\n".join(lines) + "\n"
+
+# log and start tracing if switched on by env
+if ENABLED:
+    _log_to_stderr()
+if TRACE_ALLOC:
+    tracemalloc.start()
+
+if __name__ == "__main__":
+    None
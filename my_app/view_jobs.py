@@ -0,0 +1,54 @@
+#!/usr/bin/env/ python
+# views computed off the event loop, shared by sessions asking for
+# the same view while it is running
+# import packages
+import threading
+
+# running jobs by (compute name, args)
+_jobs = {}
+_lock = threading.RLock()
+
+# function to start or join computing a view
+def submit(executor, compute, key):
+    """
+    Pass executor, compute function and tuple of its args.
+    Returns future of compute, shared while it is running
+    """
+    job_key = (compute.__name__, key)
+    with _lock:
+        job = _jobs.get(job_key)
+        if job is None:
+            future = executor.submit(compute, *key)
+            job = _jobs[job_key] = {"future": future, "waiters": 0}
+            future.add_done_callback(lambda _: _drop(job_key, future))
+        job["waiters"] += 1
+        return job["future"]
+
+# function to forget finished (or cancelled) job
+def _drop(job_key, future):
+    with _lock:
+        if _jobs.get(job_key, {}).get("future") is future:
+            del _jobs[job_key]
+
+# function to stop waiting for view
+def release(compute, key, future):
+    """
+    Pass compute function and args passed to submit and its future.
+    Cancels the view if nobody waits for it and it hasn't started,
+    cancelling runs the done callback which forgets the job
+    """
+    with _lock:
+        job = _jobs.get((compute.__name__, key))
+        if job is None or job["future"] is not future:
+            return
+        job["waiters"] -= 1
+        if job["waiters"] <= 0:
+            future.cancel()
+
+# function to count running jobs
+def running():
+    """
+    Returns number of jobs submitted and not yet done
+    """
+    with _lock:
+        return len(_jobs)
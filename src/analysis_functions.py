@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# gun laws vs mass shooting rates, bootstrap and permutation intervals
+# run from project root:
+#   python src/analysis_functions.py --freq YS --n-boot 20000 --workers 4
+# import packages
+import sys
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# import functions
+import data_store as ds
+from shiny_functions import build_cumulative_cube, rates, RATE_BASE
+
+# value and rate columns, same as the app
+VALUE_LIST = ["count", "#_injured", "#_killed", "total_injured_killed"]
+RATE_LIST = ["count_per_1k", "injured_per_1k", "killed_per_1k", "total_per_1k"]
+# resamples drawn at a time, bounds memory to chunk x states x metrics
+CHUNK_SIZE = 2_000
+
+# function to create rates for many date windows
+def window_rates(cube, census, laws, windows, pop="population", law_col="lawtotal"):
+    """
+    Pass cube from build_cumulative_cube (state regions), census,
+    gun laws and list of (start, end) dates.
+    Every window is two cube slices, rates per 1k are made with
+    rates. States without incidents in a window are 0, census states
+    without gun law or population data are left out with a warning.
+    Returns states, lawtotal array (states) and rates array
+    (windows x rates x states)
+    """
+    regions = pd.Index(cube["regions"])
+    info = census.drop_duplicates("state").set_index("state")\
+    .join(laws.drop_duplicates("state").set_index("state")[law_col], how="left")
+    missing = info[pop].isna() | info[law_col].isna()
+    if missing.any():
+        warnings.warn(f"left out, no {law_col} or {pop}: {', '.join(info.index[missing])}")
+    info = info[~missing]
+    pos = regions.get_indexer(info.index)
+
+    months = cube["months"]
+    starts = np.searchsorted(months, np.array([np.datetime64(start, "D") for (start, _) in windows]))
+    ends = np.searchsorted(months, np.array([np.datetime64(end, "D") for (_, end) in windows]))
+    ends = np.maximum(starts, ends)
+    values = np.where((pos >= 0)[None, :, None], cube["cube"][:, pos, :], 0)
+    sums = values[ends] - values[starts]
+    window_rate = rates(sums, info[pop].to_numpy(dtype=float), RATE_BASE)["rate"]
+    return info.index.to_list(), info[law_col].to_numpy(dtype=float), \
+        np.moveaxis(window_rate, 2, 1)
+
+# function to correlate batches
+def corr_batch(x, y):
+    """
+    Pass x and y arrays broadcastable to (..., states).
+    Returns pearson r and least squares slope of y on x over last axis
+    """
+    xm = x - x.mean(axis=-1, keepdims=True)
+    ym = y - y.mean(axis=-1, keepdims=True)
+    sxy = (xm * ym).sum(axis=-1)
+    sxx = (xm * xm).sum(axis=-1)
+    syy = (ym * ym).sum(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return sxy / np.sqrt(sxx * syy), sxy / sxx
+
+# function to draw resample index matrix
+def resample_index(rng, size, n, kind="bootstrap"):
+    """
+    Pass numpy Generator, number of resamples and states.
+    bootstrap draws with replacement, permutation shuffles.
+    Returns (size, n) index matrix
+    """
+    if kind == "bootstrap":
+        return rng.integers(0, n, size=(size, n))
+    return np.argsort(rng.random((size, n)), axis=1)
+
+# function to run block of resamples
+def resample_block(x, y, kind, size, seed, chunk=CHUNK_SIZE):
+    """
+    Pass lawtotal (states), rates (..., states), kind, number of
+    resamples and seed. Index matrices are drawn chunk rows at a
+    time and every window/metric is done in one array operation.
+    Bootstrap resamples states, permutation shuffles lawtotal.
+    Returns r and slope arrays (..., size)
+    """
+    rng = np.random.default_rng(seed)
+    n = x.shape[-1]
+    r_list, slope_list = [], []
+    for done in range(0, size, chunk):
+        idx = resample_index(rng, min(chunk, size - done), n, kind)
+        if kind == "bootstrap":
+            r, slope = corr_batch(x[idx], y[..., idx])
+        else:
+            r, slope = corr_batch(x[idx], y[..., None, :])
+        r_list.append(r)
+        slope_list.append(slope)
+    return np.concatenate(r_list, axis=-1), np.concatenate(slope_list, axis=-1)
+
+# function to run resamples across processes
+def resample(x, y, kind, size, seed=0, workers=1, chunk=CHUNK_SIZE):
+    """
+    Pass lawtotal, rates, kind, number of resamples and seed.
+    Splits resamples into one block per worker, each with its own
+    seed from SeedSequence so results only depend on seed and workers.
+    Returns r and slope arrays (..., size)
+    """
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    sizes = [len(part) for part in np.array_split(np.arange(size), workers)]
+    if workers == 1:
+        return resample_block(x, y, kind, size, seeds[0], chunk)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        blocks = list(pool.map(resample_block, [x] * workers, [y] * workers,
+                               [kind] * workers, sizes, seeds, [chunk] * workers))
+    return np.concatenate([r for (r, _) in blocks], axis=-1), \
+        np.concatenate([slope for (_, slope) in blocks], axis=-1)
+
+# function to test gun laws vs rates
+def law_rate_test(x, y, n_boot=10_000, n_perm=10_000, alpha=0.05, seed=0,
+                  workers=1, chunk=CHUNK_SIZE):
+    """
+    Pass lawtotal (states) and rates (..., states).
+    Returns dict of arrays (...): r, slope, bootstrap percentile
+    intervals of both and two sided permutation p value of r
+    """
+    r, slope = corr_batch(x, y)
+    boot_r, boot_slope = resample(x, y, "bootstrap", n_boot, seed, workers, chunk)
+    perm_r, _ = resample(x, y, "permutation", n_perm, seed + 1, workers, chunk)
+    q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+    r_low, r_high = np.nanpercentile(boot_r, q, axis=-1)
+    slope_low, slope_high = np.nanpercentile(boot_slope, q, axis=-1)
+    extreme = (np.abs(perm_r) >= np.abs(r)[..., None] - 1e-12).sum(axis=-1)
+    return {"r": r, "r_low": r_low, "r_high": r_high, "slope": slope,
+            "slope_low": slope_low, "slope_high": slope_high,
+            "p_value": (extreme + 1) / (n_perm + 1)}
+
+# function to create date windows
+def date_windows(start, end, freq=None):
+    """
+    Pass first and last month and pandas frequency (e.g. YS, QS).
+    None gives the whole range. Windows are start <= date < end.
+    Returns list of (start, end) dates
+    """
+    end = (pd.Timestamp(end).to_period("M") + 1).to_timestamp()
+    if freq is None:
+        return [(pd.Timestamp(start), end)]
+    bounds = pd.date_range(start, end, freq=freq)
+    bounds = bounds.union([pd.Timestamp(start), end])
+    return list(zip(bounds[:-1], bounds[1:]))
+
+# function to analyze gun laws vs rates
+def law_rate_analysis(df_month, census, laws, windows, rate_list=RATE_LIST,
+                      exclude_states=tuple(ds.EXCLUDE_STATES), **kwargs):
+    """
+    Pass monthly state table, census, gun laws and date windows.
+    exclude_states are dropped from the incidents and census.
+    Tests every window and rate in one batch, kwargs go to law_rate_test.
+    Returns df of window, metric, states and test results
+    """
+    df_month = df_month[~df_month["state"].isin(exclude_states)]
+    census = census[~census["state"].isin(exclude_states)]
+    cube = build_cumulative_cube(df_month, VALUE_LIST)
+    states, x, rates = window_rates(cube, census, laws, windows)
+    idx = [RATE_LIST.index(rate) for rate in rate_list]
+    results = law_rate_test(x, rates[:, idx, :], **kwargs)
+    df = pd.DataFrame({"start": np.repeat([start for (start, _) in windows], len(idx)),
+                       "end": np.repeat([end for (_, end) in windows], len(idx)),
+                       "metric": list(rate_list) * len(windows),
+                       "states": len(states)})
+    for (col, values) in results.items():
+        df[col] = values.ravel()
+    return df
+
+# function to run from command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gun laws vs mass shooting rates")
+    parser.add_argument("--store", default="./my_app/data",
+                        help="directory with df_yr_mon_state, census and gun laws")
+    parser.add_argument("--freq", default=None,
+                        help="window frequency, e.g. YS or QS, default whole range")
+    parser.add_argument("--n-boot", type=int, default=10_000, help="bootstrap resamples")
+    parser.add_argument("--n-perm", type=int, default=10_000, help="permutations")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args(argv)
+    df_month = ds.load_table("df_yr_mon_state", args.store)
+    dates = pd.to_datetime(df_month["date"])
+    windows = date_windows(dates.min(), dates.max(), args.freq)
+    df = law_rate_analysis(df_month, ds.load_table("df_us_census", args.store),
+                           ds.load_table("df_gun_laws", args.store), windows,
+                           n_boot=args.n_boot, n_perm=args.n_perm, seed=args.seed,
+                           workers=args.workers)
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(df.round({col: 4 for col in df.select_dtypes("number").columns})\
+              .to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# import packages
+import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+# import functions
+import data_store as ds
+import geometry_functions as gf
+
+# bump to rebuild every figure after changing plot functions
+BUILD_VERSION = 1
+# record of input hashes of built figures
+MANIFEST = ".build_manifest.json"
+# static map width in pixels, create_choropleth_map figsize x dpi
+MAP_WIDTH_PX = 50 * 250
+
+# function to sum incidents per state
+def state_totals(tables):
+    """
+    Pass dict of loaded tables.
+    Returns df of incident count, injured and killed per state
+    """
+    df = tables["df_gun"].copy()
+    df["total_injured_killed"] = df["#_killed"] + df["#_injured"]
+    return df.groupby("state", observed=True)\
+    .agg({"incident_id": "count", "#_injured": "sum", "#_killed": "sum",
+          "total_injured_killed": "sum"})\
+    .rename(columns={"incident_id": "count"}).reset_index()
+
+# function to create per 1k rates per state
+def state_per_1k(tables, drop_dc=False):
+    """
+    Pass dict of loaded tables.
+    Joins census and creates per 1k cols, same as the app.
+    Returns df sorted by incident count per 1k
+    """
+    from shiny_functions import rate_table
+    df = state_totals(tables).merge(tables["df_us_census"], how="outer")
+    if drop_dc:
+        df = df[df["state"] != "District of Columbia"]
+    df = rate_table(df, ["count", "#_injured", "#_killed", "total_injured_killed"],
+                    ["count_per_1k", "injured_per_1k", "killed_per_1k", "total_per_1k"],
+                    decimals=2)
+    return df.sort_values("count_per_1k", ascending=False).reset_index(drop=True)
+
+# function to join per 1k rates with shapes
+def state_shp_per_1k(tables, drop_dc=False):
+    """
+    Pass dict of loaded tables.
+    Returns GeoDataFrame of per 1k rates per state
+    """
+    import geopandas as gpd
+    df = state_per_1k(tables, drop_dc)
+    return gpd.GeoDataFrame(df.merge(tables["us_shp"], left_on="state",
+                                     right_on="name"))
+
+# function to count incidents per weekday
+def day_counts(tables):
+    """
+    Pass dict of loaded tables.
+    Returns df of incident count per day name
+    """
+    return tables["df_gun"].groupby("dayname", observed=True)["incident_id"]\
+    .count().rename("count").sort_values(ascending=False).reset_index()
+
+# data for each figure
+DATASETS = {"state_totals": state_totals, "state_per_1k": state_per_1k,
+            "state_shp_per_1k": state_shp_per_1k, "day_counts": day_counts}
+# optional tables a dataset needs, its figures are skipped without them
+DATASET_TABLES = {"state_shp_per_1k": ["us_shp"]}
+
+# figures in images/ drawn by general_functions plot functions
+# plot is a general_functions function, data a DATASETS entry,
+# levels passes the simplified state shapes for the map size
+# sort is the column rows are sorted by (descending) before plotting,
+# bar_horiz reverses its palette so bars must be in value order
+# Per 1k Distributions, Mass Shooting Count per 1k vs. Law Total and the
+# average/total killed or injured by day, day type, month type and season
+# figures were made in the exploration notebook with inline seaborn code,
+# not a general_functions plot, so they are not rebuilt here
+FIGURES = [
+    {"plot": "bar_horiz", "data": "state_totals", "sort": "#_killed",
+     "kwargs": {"colx": "#_killed", "coly": "state", "xlabel": "Number Killed",
+                "title": "Number Killed by State", "palette": "Reds"}},
+    {"plot": "bar_horiz", "data": "state_totals", "sort": "#_injured",
+     "kwargs": {"colx": "#_injured", "coly": "state", "xlabel": "Number Injured",
+                "title": "Number Injured by State", "palette": "Greens"}},
+    {"plot": "bar_horiz", "data": "state_per_1k", "sort": "count_per_1k",
+     "kwargs": {"colx": "count_per_1k", "coly": "state", "xlabel": "Incidents per 1k",
+                "title": "Incident by State per 1k"}},
+    {"plot": "bar_horiz", "data": "state_per_1k", "sort": "killed_per_1k",
+     "kwargs": {"colx": "killed_per_1k", "coly": "state", "xlabel": "Killed per 1k",
+                "title": "Killed by State per 1k", "palette": "Reds"}},
+    {"plot": "bar_horiz", "data": "state_per_1k", "sort": "injured_per_1k",
+     "kwargs": {"colx": "injured_per_1k", "coly": "state", "xlabel": "Injured per 1k",
+                "title": "Injured by State per 1k", "palette": "Greens"}},
+    {"plot": "bar_horiz", "data": "state_per_1k", "sort": "total_per_1k",
+     "kwargs": {"colx": "total_per_1k", "coly": "state",
+                "xlabel": "Injured and Killed per 1k",
+                "title": "Injured and Killed by State per 1k", "palette": "Purples"}},
+    {"plot": "bar_horiz", "data": "day_counts", "sort": "count",
+     "kwargs": {"colx": "count", "coly": "dayname", "xlabel": "Incident Count",
+                "title": "Incident Count by Day of the Week"}},
+    {"plot": "create_choropleth_map", "data": "state_shp_per_1k",
+     "data_kwargs": {"drop_dc": True}, "levels": True,
+     "kwargs": {"col": "count_per_1k", "color_map": "Blues", "vmax": 1,
+                "title": "Mass Shooting Incident Count per 1k\n(2019-2022)"}},
+    {"plot": "create_choropleth_map", "data": "state_shp_per_1k", "levels": True,
+     "kwargs": {"col": "count_per_1k", "color_map": "Blues", "vmax": 4,
+                "title": "Mass Shooting Incident Count per 1k\nwith Washington DC\n(2019-2022)"}},
+]
+
+# function to get figure file id
+def figure_id(figure):
+    """
+    Pass figure spec.
+    Returns file name the plot function saves to
+    """
+    return figure["kwargs"]["title"].lower().replace(" ", "_")
+
+# function to hash figure inputs
+def figure_hash(figure, df, shp_levels=None):
+    """
+    Pass figure spec, its data and simplified shapes it draws.
+    Returns sha256 of data, shapes, parameters and BUILD_VERSION
+    """
+    sha = hashlib.sha256()
+    sha.update(json.dumps([BUILD_VERSION, figure], sort_keys=True).encode())
+    for (level, level_gdf) in sorted((shp_levels or {}).items()):
+        sha.update(level.encode())
+        sha.update(b"".join(level_gdf.geometry.to_wkb()))
+    if hasattr(df, "set_geometry"):
+        sha.update(b"".join(df.geometry.to_wkb()))
+        df = pd.DataFrame(df.drop(columns=df.geometry.name))
+    sha.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    sha.update(str(list(df.columns)).encode())
+    return sha.hexdigest()
+
+# function to render figure in worker
+def render_figure(figure, df, images_path="images", shp_levels=None):
+    """
+    Pass figure spec, its data, output directory and simplified
+    shapes for maps.
+    Draws with non-interactive backend and closes the figure.
+    Returns figure id
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import general_functions
+    # save_fig writes to IMAGES_PATH
+    general_functions.IMAGES_PATH = images_path
+    kwargs = dict(figure["kwargs"])
+    if shp_levels:
+        kwargs["shp_levels"] = shp_levels
+    getattr(general_functions, figure["plot"])(df, **kwargs)
+    plt.close("all")
+    return figure_id(figure)
+
+# function to load tables used by datasets
+def load_tables(store, levels_path="./data/parquet"):
+    """
+    Pass store directory and directory of simplified state shapes.
+    Only the level create_choropleth_map picks for MAP_WIDTH_PX is
+    loaded, maps use full shapes when levels haven't been built.
+    us_shp is None when the store has no state shapes.
+    Returns dict of tables
+    """
+    level = gf.pick_level(width_px=MAP_WIDTH_PX)
+    shp_levels = {level: gf.load_level(levels_path, level)} \
+        if ds.table_exists(f"us_shp_{level}", levels_path) else {}
+    us_shp = ds.load_table("us_shp", store, geo=True) \
+        if ds.table_exists("us_shp", store) else None
+    return {"df_gun": ds.load_table("df_gun", store),
+            "df_us_census": ds.load_table("df_us_census", store),
+            "us_shp": us_shp,
+            "shp_levels": shp_levels}
+
+# function to build report figures
+def build(store, images_path="images", workers=None, force=False,
+          levels_path="./data/parquet"):
+    """
+    Pass store directory, images directory and directory of
+    simplified state shapes.
+    Prepares each figure's data, skips figures whose data and
+    parameters hash is unchanged since the last build, and renders
+    the rest across a process pool. Figures whose dataset needs a
+    table the store doesn't have are skipped with a message.
+    Returns list of rendered figure ids
+    """
+    tables = load_tables(store, levels_path)
+    os.makedirs(images_path, exist_ok=True)
+    images_path = os.path.abspath(images_path)
+    manifest_file = os.path.join(images_path, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_file) and not force:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    # data is shared by figures, prepare each dataset once
+    data = {}
+    todo = []
+    for figure in FIGURES:
+        missing = [table for table in DATASET_TABLES.get(figure["data"], [])
+                   if tables[table] is None]
+        if missing:
+            print(f"Skipping {figure_id(figure)!r}: no {', '.join(missing)} in {store}")
+            continue
+        key = (figure["data"], json.dumps(figure.get("data_kwargs", {}), sort_keys=True))
+        if key not in data:
+            data[key] = DATASETS[figure["data"]](tables, **figure.get("data_kwargs", {}))
+        df = data[key]
+        if "sort" in figure:
+            df = df.sort_values(figure["sort"], ascending=False).reset_index(drop=True)
+        shp_levels = tables["shp_levels"] if figure.get("levels") else None
+        digest = figure_hash(figure, df, shp_levels)
+        fig_id = figure_id(figure)
+        file = os.path.join(images_path, fig_id + ".png")
+        if manifest.get(fig_id) == digest and os.path.exists(file):
+            continue
+        todo.append((figure, df, shp_levels, digest))
+
+    rendered = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(render_figure, figure, df, images_path, shp_levels): digest
+                       for (figure, df, shp_levels, digest) in todo}
+            for future in as_completed(futures):
+                fig_id = future.result()
+                manifest[fig_id] = futures[future]
+                rendered.append(fig_id)
+    finally:
+        # keep figures that finished even if one failed
+        with open(manifest_file, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"Rendered {len(rendered)} of {len(FIGURES)} figures")
+    return rendered
+
+# function to run from command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build report figures in images/")
+    parser.add_argument("--store", default="./data/pickle",
+                        help="directory of stored tables")
+    parser.add_argument("--images", default="images",
+                        help="directory figures are saved to")
+    parser.add_argument("--levels", default="./data/parquet",
+                        help="directory of simplified state shapes")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes, default cpu count")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild every figure")
+    args = parser.parse_args(argv)
+    build(args.store, args.images, args.workers, args.force, args.levels)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
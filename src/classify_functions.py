@@ -0,0 +1,153 @@
+#!/usr/bin/env/ python
+# legend classes for choropleth maps
+# import packages
+import numpy as np
+
+# number of legend classes, same as the 7 color palettes
+CLASSES = 7
+# distinct values kept by jenks_breaks, larger inputs are thinned
+MAX_JENKS = 4000
+
+# function to create equal interval breaks
+def equal_interval_breaks(values, k=CLASSES):
+    """
+    Pass array of values without NaN.
+    Returns k + 1 class edges, N equal parts from min/max
+    """
+    return np.linspace(values.min(), values.max(), k + 1)
+
+# function to create quantile breaks
+def quantile_breaks(values, k=CLASSES):
+    """
+    Pass array of values without NaN.
+    Returns class edges with about the same number of values per
+    class, repeated edges are merged so there may be fewer classes
+    """
+    return np.unique(np.quantile(values, np.linspace(0, 1, k + 1)))
+
+# function to create jenks natural breaks
+def jenks_breaks(values, k=CLASSES):
+    """
+    Pass array of values without NaN.
+    Exact Jenks (Fisher) optimal classes minimizing the sum of
+    squared deviations within classes. Works on distinct values
+    weighted by count and solves every class with a divide and
+    conquer pass done level by level as array operations, so county
+    data (~3k values) takes milliseconds.
+    Returns class edges, min then each class max
+    """
+    x, w = np.unique(values, return_counts=True)
+    # thin very long inputs to evenly spaced quantiles
+    if len(x) > MAX_JENKS:
+        x, w = np.unique(np.quantile(values, np.linspace(0, 1, MAX_JENKS)),
+                         return_counts=True)
+    m = len(x)
+    if m <= k:
+        return np.concatenate([x[:1], x])
+    w = w.astype(float)
+    cw = np.concatenate([[0.0], np.cumsum(w)])
+    cwx = np.concatenate([[0.0], np.cumsum(w * x)])
+    cwx2 = np.concatenate([[0.0], np.cumsum(w * x * x)])
+
+    # cost of one class from row i to column j, arrays of pairs
+    def class_cost(i, j):
+        count = cw[j + 1] - cw[i]
+        total = cwx[j + 1] - cwx[i]
+        return cwx2[j + 1] - cwx2[i] - total * total / count
+
+    # best cost of c + 1 classes ending at j and start of class c
+    cost = class_cost(np.zeros(m, dtype=np.int64), np.arange(m))
+    starts = np.zeros((k, m), dtype=np.int64)
+    for c in range(1, k):
+        prev = np.concatenate([[np.inf], cost[:-1]])
+        new_cost = np.full(m, np.inf)
+        # best start only moves right as j grows, so solve the middle
+        # column of every segment at once and split the row ranges
+        seg = np.array([[c, m - 1, c, m - 1]])
+        while len(seg):
+            jl, jr, il, ir = seg.T
+            mid = (jl + jr) // 2
+            hi = np.minimum(ir, mid)
+            lengths = hi - il + 1
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            seg_id = np.repeat(np.arange(len(seg)), lengths)
+            i = np.arange(lengths.sum()) - np.repeat(offsets, lengths) + il[seg_id]
+            total = prev[i] + class_cost(i, mid[seg_id])
+            lowest = np.minimum.reduceat(total, offsets)
+            first = np.flatnonzero(total == lowest[seg_id])
+            _, pick = np.unique(seg_id[first], return_index=True)
+            best = i[first[pick]]
+            starts[c, mid] = best
+            new_cost[mid] = lowest
+            seg = np.concatenate([
+                np.column_stack([jl, mid - 1, il, best])[jl <= mid - 1],
+                np.column_stack([mid + 1, jr, best, ir])[mid + 1 <= jr]])
+        cost = new_cost
+
+    # walk back from the last value
+    edges = [x[-1]]
+    j = m - 1
+    for c in range(k - 1, 0, -1):
+        i = starts[c, j]
+        edges.append(x[i - 1])
+        j = i - 1
+    edges.append(x[0])
+    return np.array(edges[::-1])
+
+# breaks function for each scheme
+SCHEMES = {"jenks": jenks_breaks, "quantile": quantile_breaks,
+           "equal_interval": equal_interval_breaks}
+
+# function to classify values
+def classify(values, k=CLASSES, scheme="jenks"):
+    """
+    Pass values (NaN ignored), number of classes and scheme
+    (jenks, quantile or equal_interval).
+    Returns list of at least two class edges, labels are rounded by
+    legend_labels
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return [0.0, 0.0]
+    # rounding edges here would merge close edges of small rates
+    breaks = [float(edge) for edge in SCHEMES[scheme](values, k)]
+    # all values equal (e.g. a range without months), one class
+    return breaks if len(breaks) > 1 else breaks * 2
+
+# function to get class of values
+def class_bins(values, breaks):
+    """
+    Pass values and class edges.
+    Class c holds edges[c] < value <= edges[c + 1], min is in class 0.
+    Returns int8 array of classes, -1 for NaN
+    """
+    values = np.asarray(values, dtype=float)
+    bins = np.searchsorted(np.asarray(breaks[1:-1]), values, side="left")
+    bins = np.clip(bins, 0, max(len(breaks) - 2, 0))
+    return np.where(np.isnan(values), -1, bins).astype(np.int8)
+
+# function to get colors for classes
+def class_colors(rgb_list, k):
+    """
+    Pass palette hex colors and number of classes.
+    Returns k (at least one) hex colors spread over the palette
+    """
+    k = max(k, 1)
+    if k == len(rgb_list):
+        return list(rgb_list)
+    from branca.colormap import LinearColormap
+    colormap = LinearColormap(rgb_list, vmin=0, vmax=1)
+    return [colormap.rgb_hex_str(x) for x in np.linspace(0, 1, k)]
+
+# function to create legend entries
+def legend_labels(breaks, rgb_list):
+    """
+    Pass class edges and one color per class.
+    Returns dict of "low - high" label -> color
+    """
+    return {f"{low:,.2f} - {high:,.2f}": color
+            for (low, high, color) in zip(breaks[:-1], breaks[1:], rgb_list)}
+
+if __name__ == "__main__":
+    None
@@ -1,51 +1,205 @@
-#!/usr/bin python3
+#!/usr/bin/env python3
 
 # import packages
-from selenium import webdriver
+import os
+import sys
+import json
 import time
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import shutil
+import filecmp
+import argparse
+from urllib.parse import urlparse
+import requests
 
-# create service object
-s = Service("/usr/local/bin/chromedriver")
+# file name ingestion looks for
+DEFAULT_NAME = "export-mass-shooting.csv"
+# http status codes worth retrying
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# census acs 5 year api, same survey as state population
+CENSUS_ACS5_URL = "https://api.census.gov/data/{year}/acs/acs5"
+# county population table the app reads in county mode
+COUNTY_CENSUS_TABLE = "df_us_census_county"
 
+# function to read saved validators
+def load_meta(dest):
+    """
+    Pass downloaded file path.
+    Returns dict with etag/last_modified of the saved copy
+    """
+    if not os.path.exists(dest) or not os.path.exists(dest + ".meta.json"):
+        return {}
+    with open(dest + ".meta.json") as f:
+        return json.load(f)
 
-# set driver specifics
-options = webdriver.ChromeOptions()
-prefs = {"download.default_directory":
-"/Users/justinwilliams/projects/gun-violence/data"}
-options.add_experimental_option("prefs", prefs)
-options.add_experimental_option("excludeSwitches", ['enable-logging'])
-driver = webdriver.Chrome(service_log_path=s, options=options)
+# function to save validators
+def save_meta(dest, meta):
+    """
+    Pass downloaded file path and dict of validators
+    """
+    with open(dest + ".meta.json", "w") as f:
+        json.dump(meta, f, indent=2)
 
-# specify url
-url="https://www.gunviolencearchive.org/mass-shooting"
+# function to download over plain http
+def fetch_http(url, dest, retries=3, backoff=2, timeout=30, chunk_size=1 << 16):
+    """
+    Pass export url and destination file.
+    Sends the saved ETag/Last-Modified so an unchanged export isn't
+    downloaded again, streams to a .part file, checks the size against
+    Content-Length and only then moves it into place.
+    Retries network errors (also a body cut off mid-stream) and
+    429/5xx with backoff, the .part file is removed after any failure.
+    Returns "downloaded" or "not_modified"
+    """
+    meta = load_meta(dest)
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
 
-# set waittime
-wait = WebDriverWait(driver, 10)
+    for attempt in range(retries + 1):
+        try:
+            with requests.get(url, headers=headers, stream=True,
+                              timeout=timeout) as r:
+                if r.status_code == 304:
+                    return "not_modified"
+                if r.status_code in RETRY_STATUS and attempt < retries:
+                    raise requests.HTTPError(f"status {r.status_code}")
+                r.raise_for_status()
+                size = 0
+                with open(dest + ".part", "wb") as f:
+                    for chunk in r.iter_content(chunk_size):
+                        f.write(chunk)
+                        size += len(chunk)
+                expected = r.headers.get("Content-Length")
+                # length is of the encoded body, skip check if compressed
+                if expected and not r.headers.get("Content-Encoding") \
+                    and size != int(expected):
+                    raise requests.HTTPError(f"got {size} of {expected} bytes")
+                if size == 0:
+                    raise requests.HTTPError("empty download")
+                os.replace(dest + ".part", dest)
+                save_meta(dest, {"url": url,
+                                 "etag": r.headers.get("ETag"),
+                                 "last_modified": r.headers.get("Last-Modified")})
+                return "downloaded"
+        except requests.RequestException as e:
+            # client errors like 404 or a bad url won't get better
+            response = getattr(e, "response", None)
+            if response is not None and response.status_code not in RETRY_STATUS:
+                raise
+            if isinstance(e, ValueError):
+                raise
+            if attempt == retries:
+                raise
+            print(f"Download failed ({e}), retrying")
+            time.sleep(backoff ** attempt)
+        finally:
+            # partial download, also on errors that aren't retried
+            if os.path.exists(dest + ".part"):
+                os.remove(dest + ".part")
 
-try:    
-    # open browser
-    driver.maximize_window()
-    driver.get(url)
+# function to copy local file or fixture
+def fetch_file(source, dest, **kwargs):
+    """
+    Pass local file path (or file:// url) and destination file.
+    Used offline and for tests, same results as fetch_http.
+    Returns "downloaded" or "not_modified"
+    """
+    path = urlparse(source).path if source.startswith("file://") else source
+    if os.path.exists(dest) and filecmp.cmp(path, dest, shallow=False):
+        return "not_modified"
+    shutil.copyfile(path, dest + ".part")
+    os.replace(dest + ".part", dest)
+    return "downloaded"
 
-    # click export button
-    export_xpath = '//*[@id="content"]/div/div/div/div[1]/ul/li[2]/a'
-    export_button = wait.until(EC.element_to_be_clickable((By.XPATH, export_xpath)))
-    export_button.click()
+# fetch backends by url scheme
+FETCHERS = {"http": fetch_http, "https": fetch_http, "file": fetch_file}
 
-    # click download button
-    dl_xpath = '//*[@id="block-system-main"]/div/a[1]'
-    dl_button = wait.until(EC.element_to_be_clickable((By.XPATH, dl_xpath)))
-    dl_button.click()
+# function to fetch export with matching backend
+def fetch(source, dest_dir, name=DEFAULT_NAME, backend=None, **kwargs):
+    """
+    Pass export url or local path and download directory.
+    Backend is picked from the url scheme (local paths use file),
+    or pass one of FETCHERS. Extra kwargs go to the backend.
+    Returns (status, file path)
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    dest = os.path.join(dest_dir, name)
+    if backend is None:
+        backend = urlparse(source).scheme or "file"
+    status = FETCHERS[backend](source, dest, **kwargs)
+    print(f"{name}: {status}")
+    return status, dest
 
-    # wait for download to comlete
-    time.sleep(5)
-
-except:
-    print("something went wrong")
+# function to download county population
+def fetch_county_population(api_key, year=2020, timeout=60):
+    """
+    Pass census api key.
+    Gets ACS 5 year population (B01003_001E) of every county.
+    Returns df of county_fips, county, state and population,
+    layout of df_us_census for county mode
+    """
+    import pandas as pd
+    params = {"get": "NAME,B01003_001E", "for": "county:*", "key": api_key}
+    r = requests.get(CENSUS_ACS5_URL.format(year=year), params=params,
+                     timeout=timeout)
+    r.raise_for_status()
+    rows = r.json()
+    df = pd.DataFrame(rows[1:], columns=rows[0])
+    # state and county cols are fips codes
+    df["county_fips"] = df["state"] + df["county"]
+    # NAME is "Cook County, Illinois"
+    df[["county", "state"]] = df["NAME"].str.rsplit(", ", n=1, expand=True)
+    df["population"] = df["B01003_001E"].astype(float)
+    return df[["county_fips", "county", "state", "population"]]
 
+# function to save county population
+def save_county_population(api_key, paths, year=2020):
+    """
+    Pass census api key and directories (e.g. ./data/parquet and
+    ./my_app/data).
+    Writes df_us_census_county to each.
+    Returns df
+    """
+    import data_store as ds
+    df = fetch_county_population(api_key, year)
+    for path in paths:
+        ds.save_table(df, COUNTY_CENSUS_TABLE, path)
+        print(f"{COUNTY_CENSUS_TABLE}: saved to {path}")
+    return df
 
+# function to run from command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download GVA export csv")
+    parser.add_argument("source", nargs="?", default=None,
+                        help="GVA export csv url or local file")
+    parser.add_argument("--dest", default="./data",
+                        help="download directory")
+    parser.add_argument("--name", default=DEFAULT_NAME,
+                        help="saved file name")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="http retries")
+    parser.add_argument("--county-population", nargs="+", default=None,
+                        metavar="DIR",
+                        help="save county population for county mode to these directories")
+    parser.add_argument("--census-key", default=os.environ.get("CENSUS_API_KEY"),
+                        help="census api key, default CENSUS_API_KEY")
+    parser.add_argument("--year", type=int, default=2020,
+                        help="ACS 5 year survey year")
+    args = parser.parse_args(argv)
+    if args.source is None and args.county_population is None:
+        parser.error("pass a source and/or --county-population")
+    if args.county_population is not None:
+        if not args.census_key:
+            parser.error("--county-population needs --census-key or CENSUS_API_KEY")
+        save_county_population(args.census_key, args.county_population, args.year)
+    if args.source is None:
+        return 0
+    backend = urlparse(args.source).scheme or "file"
+    kwargs = {"retries": args.retries} if FETCHERS[backend] is fetch_http else {}
+    fetch(args.source, args.dest, args.name, backend, **kwargs)
+    return 0
 
+if __name__ == "__main__":
+    sys.exit(main())
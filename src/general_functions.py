@@ -10,6 +10,9 @@ import matplotlib as mpl
 import seaborn as sns
 import folium
 import calendar
+from geometry_functions import pick_level, apply_level
+# kept importable from here for the notebooks
+from data_store import clean_cols
 
 # set directory
 PROJECT_DIR = os.path.dirname("..")
@@ -28,11 +31,6 @@ def save_fig(fig_id, tight_layout=True, fig_extension="png", resolution=250, tra
         plt.tight_layout()
     plt.savefig(path, format=fig_extension, dpi=resolution, transparent=transparent)
 
-# general function for cleaning columns
-def clean_cols(df):
-    df.columns = [x.lower().replace(" ","_") for x in df.columns]
-    return df
-
 # histogram function
 def hist_func(df, col, title, xlabel):
     """
@@ -79,11 +77,19 @@ def ratio_func(df,col1_list,col2_list,new_col_list):
         df[new_col] = df[col1] / df[col2]
 
 # function that can easily recreate map given parameters
-def create_choropleth_map(df, col, color_map, title, vmax):
+def create_choropleth_map(df, col, color_map, title, vmax, shp_levels=None,
+                          figsize=(50,40), resolution=250):
     '''
     Takes input of dataframe, column, cmap, title and vmax. 
     Creates choropleth map with colorbar.
+    Pass shp_levels (dict of simplified shapes) to draw the coarsest
+    level that still looks full detail at figsize and resolution.
     '''
+    # swap in simplified geometry for output size
+    if shp_levels:
+        level = pick_level(width_px=figsize[0] * resolution)
+        df = apply_level(df, shp_levels[level])
+
     # get continental us shp for boundaries for map
     drop_continental = ["Alaska", "Hawaii"]
     gdf_cont = df[~df["state"].isin(drop_continental)]
@@ -91,7 +97,7 @@ def create_choropleth_map(df, col, color_map, title, vmax):
     # set color min
     vmin = 0
     # create map figure and axes
-    fig, ax = plt.subplots(figsize=(50,40))
+    fig, ax = plt.subplots(figsize=figsize)
     # call .plot() method on df
     ax = df.plot(column = col, 
                             cmap=color_map, 
@@ -126,18 +132,44 @@ def create_choropleth_map(df, col, color_map, title, vmax):
     ax.set_ylim(ylim)
     # remove axis surrounding map
     ax.set_axis_off()
-    save_fig(title.lower().replace(' ', '_'))
+    save_fig(title.lower().replace(' ', '_'), resolution=resolution)
     plt.show()
 
 # function to create interactive folium map
 def interactive_choro(gdf, shpfile,col_key_val_list, tooltip_col_list, tooltip_name_list,
                      popup_col_list, popup_name_list, fill_color="Blues", 
-                      tiles="OpenStreetMap", legend_name = "Data Points"):
+                      tiles="OpenStreetMap", legend_name = "Data Points",
+                      bins=6, precision=4):
     """
     Function that takes in GeoDataframe, Column Key and Value,
     Tooltip/Popup list and name list (must be same length)
-    Default values are: fill_color, tiles and legend_name
+    Each shape is drawn once, colored from a value -> color table,
+    with only the key, value, tooltip and popup columns kept and
+    coordinates rounded to precision decimals.
+    shpfile is only used when gdf has no geometry (joined on key).
+    Default values are: fill_color, tiles, legend_name, bins and precision
     """
+    from branca.colormap import StepColormap
+    from branca.utilities import color_brewer
+    key, value = col_key_val_list
+    if not hasattr(gdf, "set_geometry"):
+        gdf = gpd.GeoDataFrame(shpfile[[key, "geometry"]].merge(gdf, on=key, how="left"))
+
+    # only columns the map uses
+    cols = list(dict.fromkeys([key, value] + tooltip_col_list + popup_col_list))
+    gdf = gdf[cols + [gdf.geometry.name]].copy()
+    gdf[gdf.geometry.name] = gpd.GeoSeries.from_wkt(
+        gdf.geometry.to_wkt(rounding_precision=precision, trim=True),
+        index=gdf.index, crs=gdf.crs)
+
+    # equal interval bins, same as folium.Choropleth
+    values = gdf[value].astype(float)
+    thresholds = np.linspace(values.min(), values.max(), bins + 1)
+    colormap = StepColormap(color_brewer(fill_color, n=bins), index=thresholds,
+                            vmin=thresholds[0], vmax=thresholds[-1],
+                            caption=legend_name)
+    color_dict = {k: colormap(v) for (k, v) in zip(gdf[key], values) if pd.notna(v)}
+
     # basemap
     # f = folium.Figure(width=680, height=450)
     m = folium.Map([38, -99], 
@@ -173,61 +205,91 @@ def interactive_choro(gdf, shpfile,col_key_val_list, tooltip_col_list, tooltip_n
         """,
         max_width=800,
     )
-    
-    # add choropleth layer
-    g = folium.Choropleth(
-        geo_data=shpfile,
-        data=gdf,
-        nan_fill_color="grey",
-        nan_fill_opacity=0.5,
-        columns=col_key_val_list,
-        key_on='properties.state',
-        fill_color=fill_color,
-        fill_opacity=0.7,
-        line_opacity=0.4,
-        legend_name=legend_name,
-        highlight=True,
-    ).add_to(m)
-
 
+    # one layer for color, tooltip and popup
     folium.GeoJson(
         gdf,
         style_function=lambda feature: {
-    #         'fillColor': '#ffff00',
-    #         'color': 'black',
+            'fillColor': color_dict.get(feature['properties'][key], 'grey'),
+            'fillOpacity': 0.7 if feature['properties'][key] in color_dict else 0.5,
+            'color': 'black',
             'weight': 0.2,
+            'opacity': 0.4,
             'dashArray': '5, 5'
         },
+        highlight_function=lambda feature: {'weight': 2, 'fillOpacity': 0.9},
         tooltip=tooltip,
-        popup=popup).add_to(g)
+        popup=popup).add_to(m)
+    colormap.add_to(m)
     
     return m
 
+# function to save map as compact html
+def save_map_html(m, file, compress=True):
+    """
+    Pass folium map and file name.
+    Writes one standalone html file with indentation stripped,
+    gzipped to <file>.gz when compress (serve with Content-Encoding: gzip).
+    Returns file written
+    """
+    import gzip
+    html = m.get_root().render()
+    html = "\n".join(line.strip() for line in html.splitlines() if line.strip())
+    if compress:
+        file = file + ".gz"
+        with gzip.open(file, "wt", compresslevel=9, encoding="utf-8") as f:
+            f.write(html)
+    else:
+        with open(file, "w", encoding="utf-8") as f:
+            f.write(html)
+    return file
+
+# calendar lookups, fixed categories so chunks concat as categoricals
+MONTH_NAMES = list(calendar.month_abbr)[1:]
+DAY_NAMES = list(calendar.day_name)
+SEASON_NAMES = ["Winter", "Spring", "Summer", "Autmn"]
+DAY_TYPES = ["Weekday", "Weekend"]
+# season code by month number, index 0 unused
+SEASON_CODES = np.array([-1, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0], dtype=np.int8)
+
+# function to create calendar features from dates
+def date_features(dates):
+    """
+    Pass datetime series (whole column or one chunk).
+    Uses lookup arrays instead of per row apply or string compares.
+    Returns new df with compact cols:
+    - day, month, year, dayofweek (int)
+    - monthname, monthtype, dayname, daytype (categorical)
+    """
+    missing = dates.isna().to_numpy()
+    # NaT gets code -1 which is NaN in the categoricals
+    month = dates.dt.month.fillna(0).to_numpy(dtype=np.int8)
+    weekday = dates.dt.weekday.fillna(-1).to_numpy(dtype=np.int8)
+    # nullable ints only when there is NaT
+    int8, int16 = ("Int8", "Int16") if missing.any() else ("int8", "int16")
+    return pd.DataFrame({
+        "day": dates.dt.day.astype(int8),
+        "month": dates.dt.month.astype(int8),
+        "monthname": pd.Categorical.from_codes(month - 1, MONTH_NAMES, ordered=True),
+        "monthtype": pd.Categorical.from_codes(SEASON_CODES[month], SEASON_NAMES),
+        "year": dates.dt.year.astype(int16),
+        "dayofweek": dates.dt.weekday.astype(int8),
+        "dayname": pd.Categorical.from_codes(weekday, DAY_NAMES, ordered=True),
+        "daytype": pd.Categorical.from_codes(
+            np.where(missing, -1, weekday >= 5).astype(np.int8), DAY_TYPES),
+    }, index=dates.index)
+
 # function to create day, month, year, weekday and day name from date column
 def date_column(df, datecol):
     """
     Pass datetime column and crate new cols in df:
-    - day, month, year, weekday, dayname
+    - day, month, monthname, monthtype, year, dayofweek, dayname, daytype
     """
-    # define seasons
-    Winter = ["Dec", "Jan","Feb"]
-    Spring = ["Mar", "Apr","May"]
-    Summer = ["Jun", "Jul", "Aug"]
-    Autumn = ["Sep", "Oct","Nov"]
-    
     # extract date info
     if pd.api.types.is_datetime64_dtype(df[datecol]):
-        df["day"] = df[datecol].dt.day
-        df["month"] = df[datecol].dt.month
-        df["monthname"] = df["month"].apply(lambda x: calendar.month_abbr[x])
-        df["monthtype"] = np.where(df["monthname"].isin(Winter),"Winter",
-                                  np.where(df["monthname"].isin(Spring), "Spring",
-                                          np.where(df["monthname"].isin(Summer),"Summer",
-                                                  np.where(df["monthname"].isin(Autumn),"Autmn",'NA'))))
-        df["year"] = df[datecol].dt.year
-        df["dayofweek"] = df[datecol].dt.weekday
-        df["dayname"] = df[datecol].dt.day_name()
-        df["daytype"] = np.where(df["dayofweek"] >= 5,"Weekend","Weekday")
+        features = date_features(df[datecol])
+        for col in features.columns:
+            df[col] = features[col]
     else:
         print("Please pass datetime column")
 
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# offline geocoding of GVA place names from census gazetteer files
+# e.g. 2021_Gaz_place_national.txt and 2021_Gaz_counties_national.txt
+# from https://www.census.gov/geographies/reference-files/time-series/geo/gazetteer-files.html
+# import packages
+import difflib
+import numpy as np
+import pandas as pd
+
+# import functions
+import data_store as ds
+# place names are normalized like county names
+from geometry_functions import place_key
+
+# geocode cache table
+CACHE_TABLE = "geocode_cache"
+# state name -> abbreviation list in data/
+ABBR_FILE = "./data/abbr-name-list.csv"
+# fuzzy match cutoff, 0-1
+FUZZY_CUTOFF = 0.85
+
+# function to load gazetteer files
+def load_gazetteer(files, abbr_file=ABBR_FILE):
+    """
+    Pass list of census gazetteer files (places, counties, ...).
+    Returns df of state name, key, latitude and longitude,
+    one row per (state, key)
+    """
+    abbr = pd.read_csv(abbr_file)
+    abbr_dict = dict(zip(abbr["abbreviation"], abbr["name"]))
+    frames = []
+    for file in files:
+        gaz = pd.read_csv(file, sep="\t", dtype=str)
+        gaz.columns = [col.strip().lower() for col in gaz.columns]
+        frames.append(pd.DataFrame({
+            "state": gaz["usps"].map(abbr_dict),
+            "key": place_key(gaz["name"]),
+            "latitude": gaz["intptlat"].astype(float),
+            "longitude": gaz["intptlong"].astype(float)}))
+    gazetteer = pd.concat(frames, ignore_index=True).dropna(subset=["state"])
+    # places come first so "Springfield" beats "Springfield township"
+    return gazetteer.drop_duplicates(["state", "key"]).reset_index(drop=True)
+
+# function to load address gazetteer
+def load_address_gazetteer(file):
+    """
+    Pass csv with state, city_or_county, address, latitude, longitude.
+    Returns df keyed by state, place key and address key
+    """
+    gaz = pd.read_csv(file, dtype={"state": str, "city_or_county": str,
+                                   "address": str})
+    return pd.DataFrame({"state": gaz["state"],
+                         "key": place_key(gaz["city_or_county"]),
+                         "address_key": place_key(gaz["address"]),
+                         "latitude": gaz["latitude"],
+                         "longitude": gaz["longitude"]})\
+    .drop_duplicates(["state", "key", "address_key"])
+
+# function to fuzzy match leftover places
+def fuzzy_match(places, gazetteer, cutoff=FUZZY_CUTOFF):
+    """
+    Pass df of unmatched state, key and gazetteer.
+    Only compares against gazetteer keys of the same state.
+    Returns df of state, key, latitude, longitude for matches
+    """
+    matches = []
+    gaz_by_state = {state: group.set_index("key")
+                    for (state, group) in gazetteer.groupby("state")}
+    for (state, key) in places[["state", "key"]].itertuples(index=False):
+        group = gaz_by_state.get(state)
+        if group is None or pd.isna(key):
+            continue
+        close = difflib.get_close_matches(key, group.index, n=1, cutoff=cutoff)
+        if close:
+            row = group.loc[close[0]]
+            matches.append((state, key, row["latitude"], row["longitude"]))
+    return pd.DataFrame(matches, columns=["state", "key", "latitude", "longitude"])
+
+# function to resolve places not in cache
+def resolve_places(places, gazetteer, address_gazetteer=None):
+    """
+    Pass df of distinct state, city_or_county (and address) and gazetteer.
+    Address match first when given, then exact key match,
+    fuzzy match only for what is left.
+    Returns places with latitude, longitude and method cols
+    """
+    places = places.copy()
+    places["key"] = place_key(places["city_or_county"])
+    places["latitude"] = np.nan
+    places["longitude"] = np.nan
+    places["method"] = "none"
+
+    def fill(matched, method):
+        found = matched["latitude"].notna().to_numpy() & \
+            places["latitude"].isna().to_numpy()
+        places.loc[found, ["latitude", "longitude"]] = \
+            matched.loc[found, ["latitude", "longitude"]].to_numpy()
+        places.loc[found, "method"] = method
+
+    if address_gazetteer is not None and "address" in places.columns:
+        keys = places[["state", "key"]].assign(address_key=place_key(places["address"]))
+        fill(keys.merge(address_gazetteer, how="left",
+                        on=["state", "key", "address_key"]), "address")
+    fill(places[["state", "key"]].merge(gazetteer, how="left", on=["state", "key"]),
+         "exact")
+    left = places["latitude"].isna()
+    if left.any():
+        fuzzy = fuzzy_match(places.loc[left, ["state", "key"]].drop_duplicates(),
+                            gazetteer)
+        fill(places[["state", "key"]].merge(fuzzy, how="left", on=["state", "key"]),
+             "fuzzy")
+    return places.drop(columns="key")
+
+# function to geocode incidents
+def geocode(df, gazetteer, cache_path, address_gazetteer=None,
+            retry_missing=False):
+    """
+    Pass incident df, gazetteer and cache directory.
+    Each distinct place string is resolved once and kept in the
+    geocode cache table, later runs only resolve new places.
+    retry_missing=True looks up cached misses again. Place entries
+    (no address) and address entries are cached apart, so a run
+    without address_gazetteer gets one entry per place.
+    Returns df with latitude and longitude cols
+    """
+    cols = ["state", "city_or_county", "address"]
+    keys = df[cols[:2]].astype("string")
+    keys["address"] = df["address"].astype("string") \
+        if address_gazetteer is not None and "address" in df.columns \
+        else pd.Series(pd.NA, index=df.index, dtype="string")
+    places = keys.drop_duplicates()
+    try:
+        cache = ds.load_table(CACHE_TABLE, cache_path)
+        if retry_missing:
+            cache = cache[cache["method"] != "none"]
+    except FileNotFoundError:
+        cache = pd.DataFrame(columns=cols + ["latitude", "longitude", "method"])
+    for col in cols:
+        if col not in cache.columns:
+            cache[col] = pd.NA
+        cache[col] = cache[col].astype("string")
+    cache = cache.drop_duplicates(cols, keep="last")
+
+    # only places missing from the cache are resolved
+    known = places.merge(cache[cols], how="left", on=cols, indicator=True)
+    new = known.loc[known["_merge"] == "left_only", cols]
+    if len(new):
+        resolved = resolve_places(new, gazetteer, address_gazetteer)
+        cache = pd.concat([cache, resolved], ignore_index=True)\
+        .drop_duplicates(cols, keep="last")
+        ds.save_table(cache, CACHE_TABLE, cache_path)
+
+    located = keys.merge(cache, how="left", on=cols)
+    df = df.copy()
+    df["latitude"] = located["latitude"].to_numpy(dtype=float)
+    df["longitude"] = located["longitude"].to_numpy(dtype=float)
+    return df
+
+if __name__ == "__main__":
+    None
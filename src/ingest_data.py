@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# import packages
+import os
+import sys
+import glob
+import json
+import hashlib
+import calendar
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# import functions
+import data_store as ds
+import geometry_functions as gf
+import geocode_functions as geo
+
+# tables in store
+INCIDENT_TABLE = "df_gun_violence"
+MONTHLY_TABLE = "df_yr_mon_state"
+COUNTY_TABLE = "df_yr_mon_county"
+# record of ingested export files
+MANIFEST = "ingested_files.json"
+# export date format, e.g. December 11, 2022
+DATE_FORMAT = "%B %d, %Y"
+# compact dtypes by export column, state and city are interned
+EXPORT_DTYPES = {"Incident ID": "int64", "State": "category",
+                 "City Or County": "category", "Address": "string",
+                 "# Killed": "int16", "# Injured": "int16"}
+# rows per chunk when streaming exports
+CHUNK_SIZE = 100_000
+
+# function to hash file contents
+def file_hash(file, block_size=1 << 20):
+    """
+    Pass file path.
+    Returns sha256 hex digest of file contents
+    """
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+# function to load manifest
+def load_manifest(store):
+    """
+    Pass store directory.
+    Returns dict of file hash -> ingest info
+    """
+    path = os.path.join(store, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+# function to save manifest
+def save_manifest(manifest, store):
+    """
+    Pass manifest dict and store directory.
+    Written to temp file first so it is never half written
+    """
+    path = os.path.join(store, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+# function to stream GVA export in chunks
+def read_export_chunks(file, chunksize=CHUNK_SIZE):
+    """
+    Pass GVA export csv.
+    Reads chunksize rows at a time so memory stays flat however
+    big the export is. Dates are parsed with DATE_FORMAT, state
+    and city are categoricals and counts are int16.
+    Yields cleaned df chunks, same columns as load/clean notebook
+    """
+    reader = pd.read_csv(file, chunksize=chunksize, dtype=EXPORT_DTYPES,
+                         usecols=lambda col: col != "Operations")
+    for chunk in reader:
+        chunk["Incident Date"] = pd.to_datetime(chunk["Incident Date"],
+                                                format=DATE_FORMAT)
+        yield ds.clean_cols(chunk)
+
+# function to read GVA export
+def read_export(file, chunksize=CHUNK_SIZE):
+    """
+    Pass GVA export csv.
+    Returns cleaned df, same as load/clean notebook
+    """
+    chunks = list(read_export_chunks(file, chunksize))
+    df = pd.concat(chunks, ignore_index=True)
+    # chunks may have different categories
+    for col in ["state", "city_or_county"]:
+        df[col] = df[col].astype("category")
+    return df
+
+# function to load stored incident ids
+def stored_ids(store, chunksize=CHUNK_SIZE):
+    """
+    Pass store directory.
+    Reads only the incident_id column, chunksize rows at a time.
+    Returns sorted int64 array of incident ids (8 bytes per id)
+    """
+    if not ds.table_exists(INCIDENT_TABLE, store):
+        return np.array([], dtype=np.int64)
+    ids = [df["incident_id"].to_numpy(dtype=np.int64) for df in
+           ds.iter_table(INCIDENT_TABLE, store, columns=["incident_id"],
+                         batch_size=chunksize)]
+    return np.unique(np.concatenate(ids)) if ids else np.array([], dtype=np.int64)
+
+# function to create monthly aggregates
+def monthly_aggregates(df, exclude_states=ds.EXCLUDE_STATES, region_col="state"):
+    """
+    Pass incident df.
+    Sums injured/killed and counts incidents per year, month and
+    region (state, or county_fips for county mode).
+    Returns df in the same layout as df_yr_mon_state
+    """
+    df = df[~df["state"].isin(exclude_states)].copy()
+    df["date"] = df["incident_date"].dt.to_period("M").dt.to_timestamp()
+    df["total_injured_killed"] = df["#_killed"] + df["#_injured"]
+    df_month = df.groupby(["date", region_col], observed=True)\
+    .agg({"#_injured": "sum", "#_killed": "sum", "total_injured_killed": "sum",
+          "incident_id": "count"})\
+    .rename(columns={"incident_id": "count"}).reset_index()
+    df_month["year"] = df_month["date"].dt.year
+    df_month["month"] = df_month["date"].dt.month
+    df_month["monthname"] = [calendar.month_abbr[x] for x in df_month["month"]]
+    return df_month[["year", "monthname", region_col, "#_injured", "#_killed",
+                     "total_injured_killed", "count", "month", "date"]]
+
+# function to sum monthly aggregates of chunks
+def sum_monthly(parts, region_col="state"):
+    """
+    Pass list of monthly_aggregates dfs of chunks of incidents.
+    Returns df in the same layout with each month and region once
+    """
+    cols = ["#_injured", "#_killed", "total_injured_killed", "count"]
+    df = pd.concat(parts, ignore_index=True)
+    df[region_col] = df[region_col].astype(object)
+    df = df.groupby(["year", "monthname", region_col, "month", "date"], sort=False)[cols]\
+    .sum().reset_index()
+    df = df[parts[0].columns].astype(parts[0].dtypes.drop(region_col).to_dict())
+    if isinstance(parts[0][region_col].dtype, pd.CategoricalDtype):
+        df[region_col] = df[region_col].astype("category")
+    return df
+
+# function to aggregate stored incidents chunk by chunk
+def chunk_aggregates(store, filters=None, counties=None, chunksize=CHUNK_SIZE):
+    """
+    Pass store directory, optional filters and county GeoDataFrame.
+    Stored incidents are read chunksize rows at a time and summed per
+    month, so memory stays at one chunk plus the aggregates.
+    Returns state and county (None without counties) monthly dfs
+    """
+    # county mode needs place names and coordinates too
+    columns = None if counties is not None else \
+        ["incident_id", "incident_date", "state", "#_killed", "#_injured"]
+    state_parts, county_parts = [], []
+    for df in ds.iter_table(INCIDENT_TABLE, store, columns, filters, chunksize):
+        state_parts.append(monthly_aggregates(df))
+        if counties is not None:
+            df["county_fips"] = gf.incident_counties(df, counties)
+            county_parts.append(monthly_aggregates(df, region_col="county_fips"))
+    df_month = sum_monthly(state_parts) if state_parts else None
+    df_county = sum_monthly(county_parts, "county_fips") if county_parts else None
+    return df_month, df_county
+
+# function to replace months of aggregate table
+def replace_months(df_month, name, start, end, agg_store):
+    """
+    Pass recomputed months, table name, start/end and directory.
+    Keeps stored months outside [start, end) and saves.
+    Returns full table
+    """
+    try:
+        df_agg = ds.load_table(name, agg_store)
+        dates = pd.to_datetime(df_agg["date"])
+        df_agg = df_agg[(dates < start) | (dates >= end)]
+        df_month = pd.concat([df_agg, df_month], ignore_index=True)
+    except FileNotFoundError:
+        pass
+    df_month["date"] = pd.to_datetime(df_month["date"])
+    df_month = df_month.sort_values(["date", "count"], ascending=[True, False])
+    ds.save_table(df_month, name, agg_store)
+    return df_month
+
+# function to update monthly aggregates for new rows
+def update_monthly(start, end, store, agg_store, counties=None):
+    """
+    Pass first and last date of new rows, store and aggregate
+    directories. Months touched by new rows are recomputed from the
+    stored incidents (only those months are read, one chunk at a
+    time), other months are kept. Rerunning gives the same result.
+    Pass county GeoDataFrame to also update county aggregates.
+    """
+    start = pd.Timestamp(start).to_period("M").to_timestamp()
+    end = (pd.Timestamp(end).to_period("M") + 1).to_timestamp()
+    filters = ds.table_filters(start, end, date_col="incident_date")
+    df_month, df_county = chunk_aggregates(store, filters, counties)
+    df_month = replace_months(df_month, MONTHLY_TABLE, start, end, agg_store)
+    if counties is not None:
+        replace_months(df_county, COUNTY_TABLE, start, end, agg_store)
+    return df_month
+
+# function to rebuild county aggregates
+def backfill_counties(store, agg_store, counties):
+    """
+    Pass store and aggregate directories and county GeoDataFrame.
+    Recomputes county aggregates for every stored incident, one chunk
+    at a time, for months ingested before county mode was on or
+    after geocoding.
+    Returns county aggregate df
+    """
+    _, df_month = chunk_aggregates(store, counties=counties)
+    df_month = df_month.sort_values(["date", "count"], ascending=[True, False])
+    ds.save_table(df_month, COUNTY_TABLE, agg_store)
+    return df_month
+
+# function to ingest export directory
+def ingest(export_dir, store, agg_store=None, pattern="export-*.csv",
+           chunksize=CHUNK_SIZE, counties=None, gazetteer=None):
+    """
+    Pass directory of GVA exports and store directory.
+    Only files whose contents weren't ingested before are read,
+    chunk by chunk. Rows are deduped on incident_id against the
+    stored table and each chunk is appended as it is read, then
+    monthly aggregates are updated once per file.
+    Pass county GeoDataFrame to also keep county aggregates.
+    County aggregates are backfilled from all stored incidents the
+    first time counties is passed.
+    Pass gazetteer df to add latitude/longitude to new rows, places
+    are cached in the store so each is resolved once.
+    Returns number of new rows
+    """
+    agg_store = agg_store or store
+    os.makedirs(store, exist_ok=True)
+    manifest = load_manifest(store)
+    # months ingested before county mode have no county rows
+    if counties is not None and ds.table_exists(INCIDENT_TABLE, store) \
+            and not ds.table_exists(COUNTY_TABLE, agg_store):
+        backfill_counties(store, agg_store, counties)
+    total = 0
+    for file in sorted(glob.glob(os.path.join(export_dir, pattern))):
+        digest = file_hash(file)
+        if digest in manifest:
+            continue
+        # drop parts of an unfinished run of this file, then load ids
+        ds.remove_parts(INCIDENT_TABLE, store, digest[:16])
+        seen_ids = stored_ids(store)
+        rows, new_rows = 0, 0
+        start, end = None, None
+        for (i, chunk) in enumerate(read_export_chunks(file, chunksize)):
+            rows += len(chunk)
+            chunk = chunk.drop_duplicates("incident_id")
+            df_new = chunk[~chunk["incident_id"].isin(seen_ids)]
+            if not len(df_new):
+                continue
+            if gazetteer is not None:
+                df_new = geo.geocode(df_new, gazetteer, store)
+            else:
+                # every part has coordinate cols, NaN until geocoded
+                df_new = df_new.assign(latitude=np.nan, longitude=np.nan)
+            # parts named by hash so a rerun replaces them
+            ds.append_table(df_new, INCIDENT_TABLE, store, f"{digest[:16]}-{i}")
+            seen_ids = np.union1d(seen_ids, df_new["incident_id"].to_numpy(dtype=np.int64))
+            new_rows += len(df_new)
+            dates = df_new["incident_date"]
+            start = dates.min() if start is None else min(start, dates.min())
+            end = dates.max() if end is None else max(end, dates.max())
+        if new_rows:
+            update_monthly(start, end, store, agg_store, counties)
+        manifest[digest] = {"file": os.path.basename(file), "rows": rows,
+                            "new_rows": new_rows,
+                            "ingested": datetime.now().isoformat(timespec="seconds")}
+        save_manifest(manifest, store)
+        print(f"Ingested {os.path.basename(file)}: {new_rows} new of {rows} rows")
+        total += new_rows
+    return total
+
+# function to run from command line
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest new GVA export files")
+    parser.add_argument("export_dir", nargs="?", default="./data",
+                        help="directory of GVA export csv files")
+    parser.add_argument("--store", default="./data/parquet",
+                        help="directory of stored tables")
+    parser.add_argument("--agg-store", default="./my_app/data",
+                        help="directory for monthly aggregates the app reads")
+    parser.add_argument("--pattern", default="export-*.csv",
+                        help="export file name pattern")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE,
+                        help="rows read at a time")
+    parser.add_argument("--counties", action="store_true",
+                        help="also update county aggregates (needs us_county_full in store)")
+    parser.add_argument("--backfill-counties", action="store_true",
+                        help="rebuild county aggregates from all stored incidents")
+    parser.add_argument("--gazetteer", nargs="+", default=None,
+                        help="census gazetteer files to geocode new rows with")
+    args = parser.parse_args(argv)
+    counties = gf.load_level(args.store, "full", name="us_county") \
+        if args.counties or args.backfill_counties else None
+    gazetteer = geo.load_gazetteer(args.gazetteer) if args.gazetteer else None
+    total = ingest(args.export_dir, args.store, args.agg_store, args.pattern,
+                   args.chunksize, counties, gazetteer)
+    print(f"{total} new rows")
+    if args.backfill_counties:
+        df_county = backfill_counties(args.store, args.agg_store or args.store, counties)
+        print(f"Backfilled {len(df_county)} county months")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,13 @@
 #!/usr/bin/env/ python
 # import packages
+# widget and plotting packages are imported where used,
+# so data code and app start up don't pay for them
 import numpy as np
 import pandas as pd
-import ipyleaflet
-from branca.colormap import linear
-import matplotlib as mpl
-import ipywidgets
+import json
+import functools
+from statistics import NormalDist
+import classify_functions as cf
 
 # groupby func
 def groupby_mult(df, groupby_list, agg_dict, sort_list):
@@ -17,22 +19,240 @@ def groupby_mult(df, groupby_list, agg_dict, sort_list):
     .sort_values(by=sort_list,ascending=False).reset_index()
     return df_grouped
 
+# function to build cumulative region x month cube
+def build_cumulative_cube(df, value_list, region_col="state", date_col="date"):
+    """
+    Pass df of monthly rows per region and list of value columns.
+    Sums values into a months x regions x values array and takes the
+    cumulative sum over months, so any date range is two slices.
+    Returns dict with months, regions, value_list and cube
+    """
+    dates = pd.to_datetime(df[date_col]).to_numpy().astype("datetime64[D]")
+    months = np.unique(dates)
+    region_values = np.asarray(df[region_col].to_numpy(), dtype=object)
+    regions = np.unique(region_values)
+    # position of each row in the cube, month 0 is left empty
+    month_idx = np.searchsorted(months, dates) + 1
+    region_idx = np.searchsorted(regions, region_values)
+    cube = np.zeros((len(months) + 1, len(regions), len(value_list)),
+                    dtype=np.int64)
+    np.add.at(cube, (month_idx, region_idx), df[value_list].to_numpy())
+    cube = cube.cumsum(axis=0)
+    return {"months": months, "regions": regions, "value_list": list(value_list),
+            "region_col": region_col, "cube": cube}
+
+# function to sum cube over date range
+def cube_range_sum(cube, start, end, sort_list=None):
+    """
+    Pass cube from build_cumulative_cube and start/end dates.
+    Sums every region over months >= start and < end.
+    Regions without rows in range are dropped, same as a groupby.
+    Returns new df sorted by sort_list
+    """
+    months = cube["months"]
+    i = np.searchsorted(months, np.datetime64(start, "D"), side="left")
+    j = np.searchsorted(months, np.datetime64(end, "D"), side="left")
+    j = max(i, j)
+    totals = cube["cube"][j] - cube["cube"][i]
+    keep = totals.any(axis=1)
+    df_range = pd.DataFrame(totals[keep], columns=cube["value_list"])
+    df_range.insert(0, cube["region_col"], cube["regions"][keep])
+    if sort_list:
+        df_range = df_range.sort_values(by=sort_list, ascending=False)\
+        .reset_index(drop=True)
+    return df_range
+
+# function to serialize geometry once
+def build_geometry_cache(gdf, key):
+    """
+    Pass GeoDataFrame and key column.
+    Serializes every feature once so geometry is never re-serialized.
+    Returns dict of key -> GeoJSON feature
+    """
+    features = json.loads(gdf.set_index(key).to_json())["features"]
+    return {feature["id"]: feature for feature in features}
+
+# function to patch values into cached geometry
+def patch_geojson(geometry_cache, df):
+    """
+    Pass geometry cache and df indexed by the same key.
+    Row values are added to the cached feature properties,
+    geometry objects (when cached) are shared not copied.
+    Returns GeoJSON FeatureCollection
+    """
+    # NaN is not valid json, same as to_json use None
+    records = df.astype(object).where(df.notna(), None).to_dict("index")
+    features = []
+    for key, properties in records.items():
+        feature = geometry_cache.get(key)
+        if feature is None:
+            continue
+        features.append({**feature, "id": key,
+                         "properties": {**feature["properties"], **properties}})
+    return {"type": "FeatureCollection", "features": features}
+
+# function to strip properties from GeoJSON
+def geometry_only(geojson_gdf):
+    """
+    Pass GeoJSON FeatureCollection.
+    Keeps feature id and geometry only, geometry objects are shared.
+    Returns GeoJSON FeatureCollection sent to the browser
+    """
+    return {"type": "FeatureCollection",
+            "features": [{"id": feature["id"], "type": "Feature", "properties": {},
+                          "geometry": feature["geometry"]}
+                         for feature in geojson_gdf["features"]]}
+
+# function to split geometry from cached features
+def serialize_geometry(geometry_cache):
+    """
+    Pass geometry cache from build_geometry_cache.
+    Geometry is serialized once to bytes workers can share, the
+    properties stay parsed for hover/click info.
+    Returns geometry only GeoJSON as uint8 array and properties cache
+    """
+    geometry = json.dumps(geometry_only({"features": list(geometry_cache.values())}))
+    properties = {key: {"id": key, "type": "Feature", "properties": feature["properties"]}
+                  for (key, feature) in geometry_cache.items()}
+    return np.frombuffer(geometry.encode(), dtype=np.uint8), properties
+
+# function to parse serialized geometry
+def parse_geometry(geometry):
+    """
+    Pass uint8 array from serialize_geometry.
+    Parsed for each map layer that draws it and freed with the
+    layer, so workers hold only the (shared) bytes.
+    Returns geometry only GeoJSON FeatureCollection
+    """
+    return json.loads(geometry.tobytes())
+
+# the app's *_per_1k columns have always been people x 100 per 1k,
+# i.e. per 100k people, kept so legend and report scales don't change
+RATE_BASE = 100_000
+
+# counts up to this get exact poisson intervals, Byar's above
+EXACT_MAX = 50
+
+# function to get poisson cdf for small counts
+def poisson_cdf(k, mu):
+    """
+    Pass arrays of counts (<= EXACT_MAX) and means.
+    Returns P(X <= k) for X ~ Poisson(mu)
+    """
+    i = np.arange(EXACT_MAX + 1)
+    log_fact = np.concatenate([[0.0], np.cumsum(np.log(i[1:]))])
+    terms = np.exp(i * np.log(mu[..., None]) - mu[..., None] - log_fact)
+    return np.where(i <= k[..., None], terms, 0.0).sum(axis=-1)
+
+# function to solve poisson mean for cdf
+def poisson_mean(k, target, steps=60):
+    """
+    Pass arrays of counts (<= EXACT_MAX) and cdf targets.
+    Bisects every count at once, cdf falls as the mean grows.
+    Returns mean with P(X <= k) = target
+    """
+    low = np.zeros(k.shape)
+    high = k + 10 * np.sqrt(k + 1) + 10
+    for _ in range(steps):
+        mid = (low + high) / 2
+        above = poisson_cdf(k, mid) > target
+        low = np.where(above, mid, low)
+        high = np.where(above, high, mid)
+    return (low + high) / 2
+
+# function to get exact intervals of small counts
+@functools.lru_cache(maxsize=8)
+def exact_interval(alpha=0.05):
+    """
+    Pass alpha.
+    Returns low and high arrays for counts 0..EXACT_MAX
+    """
+    k = np.arange(EXACT_MAX + 1, dtype=float)
+    low = np.where(k > 0, poisson_mean(np.maximum(k - 1, 0), 1 - alpha / 2), 0.0)
+    return low, poisson_mean(k, alpha / 2)
+
+# function to get poisson interval of counts
+def poisson_interval(counts, alpha=0.05):
+    """
+    Pass array of counts.
+    Exact (Garwood, i.e. gamma quantile) interval for counts up to
+    EXACT_MAX, Byar's approximation of it above, where it is within
+    0.1%.
+    Returns low and high arrays of expected counts
+    """
+    counts = np.asarray(counts, dtype=float)
+    k = np.nan_to_num(counts)
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        low = np.where(k > 0, k * (1 - 1 / (9 * k) - z / (3 * np.sqrt(k))) ** 3, 0.0)
+    high = (k + 1) * (1 - 1 / (9 * (k + 1)) + z / (3 * np.sqrt(k + 1))) ** 3
+
+    # small counts, where Byar's is off the most
+    small = k <= EXACT_MAX
+    if small.any():
+        exact_low, exact_high = exact_interval(alpha)
+        ks = np.rint(k[small]).astype(int)
+        low[small] = exact_low[ks]
+        high[small] = exact_high[ks]
+    missing = np.isnan(counts)
+    return np.where(missing, np.nan, low), np.where(missing, np.nan, high)
+
+# function to create rates with confidence intervals
+def rates(counts, population, base=RATE_BASE, alpha=0.05, decimals=None):
+    """
+    Pass counts (..., regions, metrics) and population (regions).
+    Every metric, region and period is done in one array operation,
+    rates are exact counts / population * base.
+    Returns dict of rate, low and high arrays, NaN without population
+    """
+    counts = np.asarray(counts, dtype=float)
+    population = np.asarray(population, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(population > 0, base / population, np.nan)[:, None]
+    low, high = poisson_interval(counts, alpha)
+    result = {"rate": counts * scale, "low": low * scale, "high": high * scale}
+    if decimals is not None:
+        result = {name: np.round(values, decimals) for (name, values) in result.items()}
+    return result
+
+# function to create rate table
+def rate_table(df, col_list, new_col_list, pop="population", base=RATE_BASE,
+               alpha=0.05, decimals=None):
+    """
+    Pass df, column list and new column name list to function.
+    Regions without rows (NaN counts) had no incidents, so counts
+    are 0 and so are rates where there is population.
+    Returns new df with rate, <rate>_low and <rate>_high columns
+    for those passed, df is not changed
+    """
+    df = df.assign(**{col: df[col].fillna(0) for col in col_list})
+    result = rates(df[col_list].to_numpy(dtype=float), df[pop].to_numpy(dtype=float),
+                   base, alpha, decimals)
+    cols = {}
+    for (i, new_col) in enumerate(new_col_list):
+        cols[new_col] = result["rate"][:, i]
+        cols[f"{new_col}_low"] = result["low"][:, i]
+        cols[f"{new_col}_high"] = result["high"][:, i]
+    return df.assign(**cols)
+
 # function to create rate per 1k columns
 def rate_per_1k(df, col_list, new_col_list, pop="population"):
     """
     Pass df, column list and new column name list to function.
-    Will create new rate per 1k population columns for those passed
+    Will create new rate per 1k population columns for those passed.
+    Kept for the notebooks, changes df in place, use rate_table
     """
-    df["pop_per_1k"] = round(df[pop] / 1000)
-    for (col,new_col) in zip(col_list, new_col_list):
-        df[new_col] = round(df[col] / df["pop_per_1k"] * 100,2)
-    # format pop cols
+    df["pop_per_1k"] = df[pop] / 1000
+    df_rates = rate_table(df, col_list, new_col_list, pop, decimals=2)
+    for new_col in new_col_list:
+        df[new_col] = df_rates[new_col]
 
 # function to convert rgb to hex
 def rgb_to_hex(rgb_col_list):
     """
     Pass rgb colors in list and return hex
     """
+    import matplotlib as mpl
     col_list = [mpl.colors.to_hex(col) for col in rgb_col_list]
     return col_list
 
@@ -41,6 +261,7 @@ def rgb_to_hex(rgb_col_list):
 def divide_metric(df,colmetric,parts=7):
     """
     Pass df and creates N equal parts from min/max
+    Kept for the notebooks, the app uses classify_functions.classify
     Returns list
     """
     min_metric = min(df[colmetric])
@@ -49,19 +270,21 @@ def divide_metric(df,colmetric,parts=7):
     metric = [round(x,2) for x in metric]
     return metric
 
-# function to generate map
-def int_choro_ipyleaflet(geojson_gdf, gdf, value, title, metric, rgb_list,
-                         colormap):
+# function to create persistent map
+def create_choro_ipyleaflet(geojson_gdf):
     """
-    Returns an interactive choropleth ipyleaflet map
-    Pass GeoJSON indexed by key in key, value (column you want to express)
-    GeoDataframe where you want keys expressed from.
-    title = Legend title which acts as map title
-    Default colormap is blue
+    Returns dict of map parts for an interactive choropleth ipyleaflet map.
+    Pass GeoJSON indexed by key. One layer colors, hovers and clicks,
+    features carry id and geometry only, hover/click info is looked
+    up server side by id.
+    Values, colormap, legend and hover/click info are filled in
+    later by update_choro_ipyleaflet without rebuilding the map
     """
-    # map key value dict
-    key_value_dict =  dict(zip(gdf.index.tolist(),\
-                                   gdf[value].tolist()))
+    import ipyleaflet
+    import ipywidgets
+    from branca.colormap import linear
+    # hover/click properties by key, looked up server side
+    properties_dict = {}
 
     # label below map
     label = ipywidgets.Label(layout=ipywidgets.Layout(width="100%"))
@@ -77,36 +300,47 @@ def int_choro_ipyleaflet(geojson_gdf, gdf, value, title, metric, rgb_list,
     # add scale              
     basemap.add_control(ipyleaflet.leaflet.ScaleControl(position="bottomleft"))
 
-    # choropleth object
+    # choropleth object, no values until update
     choro_layer = ipyleaflet.Choropleth(
-        geo_data=geojson_gdf,
-        choro_data=key_value_dict,
-        colormap=colormap,
+        geo_data=geometry_only(geojson_gdf),
+        choro_data={feature["id"]: np.nan for feature in geojson_gdf["features"]},
+        value_min=0,
+        value_max=1,
+        colormap=linear.Blues_07,
         nan_color="grey",
         nan_opacity=0.5,
         border_color='black',
-        style={'fillOpacity': 0.8})
-
-    # add to basemap
-    basemap.add_layer(choro_layer)
-
-    # add on_hover and on_click info
-    hover_click_layer = ipyleaflet.GeoJSON(data=geojson_gdf,
-                            style={'color': 'black', 'fillColor': '#3366cc', 'opacity':0.0, 
-                                   'weight':1.9, 'dashArray':1, 'fillOpacity':0.0},
-                            hover_style={'stroke':True, 'color':'#4B86F7', 'weight':5,
-                                   'opacity':0.75, 'dashArray':1},
-                            name = 'states')
+        style={'fillOpacity': 0.8},
+        hover_style={'stroke':True, 'color':'#4B86F7', 'weight':5,
+                     'opacity':0.75, 'dashArray':1},
+        name = 'states')
 
     # hover callback function
     def hover_handler(event=None, feature=None, id=None, properties=None):
+        # hover can be taken over (e.g. by playback)
+        if map_parts["hover"] is not None:
+            map_parts["hover"](id)
+            return
+        properties = properties_dict.get(id)
+        if properties is None:
+            return
+        # county shapes carry their full name
+        place = properties.get("namelsad")
+        place = f'County: {place}, {properties["stusps"]}' if place \
+            else f'State: {properties["stusps"]}'
+        # 95% interval when rates came from rate_table
+        interval = f' ({properties["count_per_1k_low"]}-{properties["count_per_1k_high"]})' \
+            if "count_per_1k_low" in properties else ""
         label.value =\
-        f'State: {properties["stusps"]},\
+        f'{place},\
         Population per 1k: {properties["pop_per_1k"]},\
-        Mass Shooting per 1k: {properties["count_per_1k"]}'
+        Mass Shooting per 1k: {properties["count_per_1k"]}{interval}'
         
     # click callback function
     def click_handler(event=None, feature=None, id=None, properties=None):
+        properties = properties_dict.get(id)
+        if properties is None:
+            return
         label.value =\
         f'State: {properties["state"]},\
         Population: {properties["population"]},\
@@ -115,26 +349,236 @@ def int_choro_ipyleaflet(geojson_gdf, gdf, value, title, metric, rgb_list,
         Killed per 1k: {properties["killed_per_1k"]}'
 
     # add hover and click to layer
-    hover_click_layer.on_hover(hover_handler)
-    hover_click_layer.on_click(click_handler)
+    choro_layer.on_hover(hover_handler)
+    choro_layer.on_click(click_handler)
 
     # add to basemap
-    basemap.add_layer(hover_click_layer)
-
-    # add and customize legend
-    legend = ipyleaflet.LegendControl({metric[0]:rgb_list[0],
-                                      metric[1]:rgb_list[1],
-                                      metric[2]:rgb_list[2],
-                                      metric[3]:rgb_list[3],
-                                      metric[4]:rgb_list[4],
-                                      metric[5]:rgb_list[5],
-                                      metric[6]:rgb_list[6]}, 
-                                      name=title, position="bottomright")
+    basemap.add_layer(choro_layer)
+
+    # add legend, entries set on update
+    legend = ipyleaflet.LegendControl({}, name="", position="bottomright")
     # add to basemap
     basemap.add_control(legend)
 
+    # map and label, hover callback taking the key replaces hover info
+    map_parts = {"widget": ipywidgets.VBox([basemap, label]),
+                 "map": basemap,
+                 "choro_layer": choro_layer,
+                 "legend": legend,
+                 "label": label,
+                 "properties": properties_dict,
+                 # region keys in layer order and values shown
+                 "keys": [feature["id"] for feature in geojson_gdf["features"]],
+                 "values": None, "hover": None}
+    return map_parts
+
+# function to swap persistent map geometry
+def set_choro_geometry(map_parts, geojson_gdf):
+    """
+    Pass map parts and GeoJSON of other regions (e.g. counties).
+    Sends the new geometry in one message, values are set by the
+    next update
+    """
+    choro_layer = map_parts["choro_layer"]
+    # each trait restyles the layer, held so keys and geometry
+    # change together and are sent once
+    with choro_layer.hold_sync(), choro_layer.hold_trait_notifications():
+        choro_layer.choro_data = {feature["id"]: np.nan
+                                  for feature in geojson_gdf["features"]}
+        choro_layer.geo_data = geometry_only(geojson_gdf)
+    map_parts["properties"].clear()
+    map_parts["keys"] = [feature["id"] for feature in geojson_gdf["features"]]
+    map_parts["values"] = None
+
+# function to get colormap of classes
+@functools.lru_cache(maxsize=64)
+def class_colormap(rgb_list):
+    """
+    Pass tuple of one hex color per class.
+    Cached so the layer's colormap only changes with the colors.
+    Returns StepColormap, class c is drawn at c + 0.5
+    """
+    from branca.colormap import StepColormap
+    return StepColormap(list(rgb_list), index=list(range(len(rgb_list) + 1)),
+                        vmin=0, vmax=len(rgb_list))
+
+# function to set persistent map values
+def set_choro_values(map_parts, values, colormap, value_range=None):
+    """
+    Pass map parts, values in map key order, colormap and value
+    min/max (None keeps the layer's).
+    ipyleaflet's Choropleth deep copies and restyles all its
+    geometry for every value, colormap or min/max trait changed,
+    so only traits that changed are set, held so they are sent in
+    one message.
+    Returns list of traits set
+    """
+    choro_layer = map_parts["choro_layer"]
+    changes = {}
+    if choro_layer.colormap is not colormap:
+        changes["colormap"] = colormap
+    shown = map_parts["values"]
+    if shown is None or not np.array_equal(values, shown, equal_nan=True):
+        changes["choro_data"] = dict(zip(map_parts["keys"], values.tolist()))
+    if value_range is not None:
+        if choro_layer.value_min != value_range[0]:
+            changes["value_min"] = value_range[0]
+        if choro_layer.value_max != value_range[1]:
+            changes["value_max"] = value_range[1]
+    if changes:
+        with choro_layer.hold_sync(), choro_layer.hold_trait_notifications():
+            for (name, change) in changes.items():
+                setattr(choro_layer, name, change)
+    map_parts["values"] = values
+    return list(changes)
+
+# function to color persistent map by class
+def set_choro_classes(map_parts, bins, rgb_list):
+    """
+    Pass map parts, classes in map key order (-1 no data) and one
+    hex color per class.
+    Returns list of traits set
+    """
+    values = np.where(bins >= 0, bins + 0.5, np.nan)
+    return set_choro_values(map_parts, values, class_colormap(tuple(rgb_list)),
+                            (0.0, float(len(rgb_list))))
+
+# function to update persistent map in place
+def update_choro_ipyleaflet(map_parts, geojson_gdf, gdf, value, title, metric,
+                            rgb_list, colormap):
+    """
+    Pass map parts from create_choro_ipyleaflet and the new values.
+    metric is either class edges from classify_functions.classify
+    (one more than colors), which color regions by class and label
+    the legend with the class ranges, or the legend values of
+    divide_metric (one per color) used with colormap.
+    Regions missing from gdf are drawn as no data.
+    Updates choropleth values, colormap, legend and hover/click
+    info in place, the map widgets are never rebuilt, the layer
+    is only touched by set_choro_values for traits that changed.
+    """
+    # hover/click info by key
+    map_parts["properties"].clear()
+    map_parts["properties"].update({feature["id"]: feature["properties"]
+                                    for feature in geojson_gdf["features"]})
+
+    if len(metric) == len(rgb_list) + 1:
+        # color by class
+        bins = cf.class_bins(gdf[value].reindex(map_parts["keys"]), metric)
+        set_choro_classes(map_parts, bins, rgb_list)
+        legends = cf.legend_labels(metric, rgb_list)
+    else:
+        values = gdf[value].reindex(map_parts["keys"]).to_numpy(dtype=float)
+        value_range = (float(np.nanmin(values)), float(np.nanmax(values))) \
+            if not np.isnan(values).all() else None
+        # update choropleth, min/max are kept by the layer so set
+        # them for new values
+        set_choro_values(map_parts, values, colormap, value_range)
+        legends = dict(zip(metric, rgb_list))
+
+    # update legend, one entry per class
+    legend = map_parts["legend"]
+    legend.legends = legends
+    legend.name = title
+
+    # clear info from previous values
+    map_parts["label"].value = ""
+
+# function to create per month frames from cube
+def build_frames(cube, census, key, col_list, new_col_list, keys, window=1,
+                 pop="population"):
+    """
+    Pass cube from build_cumulative_cube, census with region col, key
+    col and population, value cols, rate col names and map keys.
+    Sums every region over the window of months ending at each month
+    (two cube slices for all months at once) and creates rates per
+    1k with rates. Keys with population but no incidents are 0, same
+    as rate_table, keys without population are NaN.
+    Returns dict of months, keys, metrics and months x keys x metrics rates
+    """
+    values = cube["cube"]
+    end = np.arange(1, values.shape[0])
+    start = np.maximum(end - window, 0)
+    idx = [cube["value_list"].index(col) for col in col_list]
+    sums = (values[end] - values[start])[:, :, idx]
+
+    # region -> map key, sums in map key order, keys without rows are 0
+    region_col = cube["region_col"]
+    regions = pd.Index(cube["regions"])
+    info = census.drop_duplicates(region_col).set_index(region_col)
+    region_keys = regions if key == region_col else info[key].reindex(regions)
+    pos = pd.Index(region_keys).get_indexer(keys)
+    sums = np.where((pos >= 0)[None, :, None], sums[:, pos, :], 0)
+
+    # population by map key
+    population = census.drop_duplicates(key).set_index(key)[pop]\
+        .reindex(keys).to_numpy(dtype=float)
+    frame_rates = rates(sums, population, RATE_BASE, decimals=2)["rate"]
+    return {"months": cube["months"], "keys": list(keys),
+            "metrics": list(new_col_list), "rates": frame_rates}
+
+# function to create playback layers
+def create_playback_layers(geojson_gdf, on_hover=None):
+    """
+    Pass GeoJSON indexed by key and optional hover callback taking
+    the key. One small layer per region, so a frame only sends the
+    regions whose color changed. Meant for few regions (states),
+    every layer is a widget of its own.
+    Returns dict of layer group, layers, keys and shown colors
+    """
+    import ipyleaflet
+    features = geometry_only(geojson_gdf)["features"]
+    layers = []
+    for feature in features:
+        layer = ipyleaflet.GeoJSON(
+            data={"type": "FeatureCollection", "features": [feature]},
+            style={'color': 'black', 'weight': 1, 'fillColor': 'grey',
+                   'fillOpacity': 0.5},
+            hover_style={'color':'#4B86F7', 'weight':5, 'opacity':0.75})
+        if on_hover is not None:
+            layer.on_hover(lambda id=None, **kwargs: on_hover(id))
+        layers.append(layer)
+    return {"group": ipyleaflet.LayerGroup(layers=layers, name="playback"),
+            "layers": layers,
+            "keys": [feature["id"] for feature in features],
+            "shown": np.full(len(features), None, dtype=object)}
+
+# function to show frame on playback layers
+def set_playback_frame(playback, bins, rgb_list):
+    """
+    Pass playback layers, bins of the frame (-1 no data) and one hex
+    color per class.
+    Only regions whose color changed since the shown frame are sent,
+    so a new palette or number of classes restyles every region it
+    recolors.
+    Returns number of regions updated
+    """
+    # no data (-1) takes the last color
+    colors = np.array([*rgb_list, "grey"], dtype=object)[bins]
+    changed = np.flatnonzero(colors != playback["shown"])
+    for i in changed:
+        style = {'color': 'black', 'weight': 1, 'fillColor': colors[i],
+                 'fillOpacity': 0.8 if bins[i] >= 0 else 0.5}
+        playback["layers"][i].style = style
+    playback["shown"] = colors
+    return len(changed)
+
+# function to generate map
+def int_choro_ipyleaflet(geojson_gdf, gdf, value, title, metric, rgb_list,
+                         colormap):
+    """
+    Returns an interactive choropleth ipyleaflet map
+    Pass GeoJSON indexed by key in key, value (column you want to express)
+    GeoDataframe where you want keys expressed from.
+    title = Legend title which acts as map title
+    Default colormap is blue
+    """
+    map_parts = create_choro_ipyleaflet(geojson_gdf)
+    update_choro_ipyleaflet(map_parts, geojson_gdf, gdf, value, title, metric,
+                            rgb_list, colormap)
+
     # display map and label
-    return ipywidgets.VBox([basemap, label])
+    return map_parts["widget"]
 
 if __name__ == "__main__":
     None
\ No newline at end of file
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# tests for choosing the app's data source
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import logging
+import pandas as pd
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "my_app"))
+import app_data as ad
+import data_store as ds
+
+# runtime bundle is only used for the tables it was built from
+def test_runtime_bundle_data_version(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(ad, "attach_app_data", lambda name, path: "bundle")
+    monkeypatch.setattr(ad, "load_app_data", lambda path: "tables")
+    ds.save_table(pd.DataFrame({"count": [1, 2]}), "df_yr_mon_state", tmp_path)
+    version = ad.data_version(tmp_path)
+    ds.publish_arrays({}, ad.RUNTIME_BUNDLE, tmp_path,
+                      {"version": ad.BUNDLE_VERSION, "data_version": version})
+    # the bundle itself isn't source data
+    assert ad.data_version(tmp_path) == version
+    assert ad.get_app_data(tmp_path) == "bundle"
+
+    # tables refreshed after the bundle was built
+    ds.save_table(pd.DataFrame({"count": [1, 3]}), "df_yr_mon_state", tmp_path)
+    with caplog.at_level(logging.WARNING, logger="app.data"):
+        assert ad.get_app_data(tmp_path) == "tables"
+    assert "built from other data" in caplog.text
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# tests for legend classes
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import itertools
+import numpy as np
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import classify_functions as cf
+
+# small rates keep distinct edges and classes
+def test_classify_small_range():
+    values = np.linspace(0, 0.05, 50)
+    for scheme in cf.SCHEMES:
+        breaks = cf.classify(values, cf.CLASSES, scheme)
+        assert len(set(breaks)) == len(breaks)
+        bins = cf.class_bins(values, breaks)
+        assert len(np.unique(bins)) == len(breaks) - 1
+        assert list(cf.legend_labels(breaks, ["#fff"] * cf.CLASSES))[0].startswith("0.00 - ")
+
+# equal values, e.g. a date range without months, make one class
+def test_classify_equal_values():
+    for values in (np.zeros(50), np.full(50, 1.5), np.array([np.nan, 2.0])):
+        for scheme in cf.SCHEMES:
+            breaks = cf.classify(values, cf.CLASSES, scheme)
+            assert len(breaks) >= 2
+            bins = cf.class_bins(values, breaks)
+            assert (bins[~np.isnan(values)] == 0).all()
+    assert cf.class_colors(["#fff"], 0) == ["#fff"]
+
+# function to get sum of squared deviations within classes
+def class_cost(values, bins):
+    """
+    Pass values and their classes.
+    Returns total squared deviation from the class means
+    """
+    return sum(((values[bins == c] - values[bins == c].mean()) ** 2).sum()
+               for c in np.unique(bins))
+
+# jenks classes are as good as the best of every split
+def test_jenks_breaks_optimal():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        values = rng.integers(0, 20, size=rng.integers(3, 10)).astype(float)
+        x = np.unique(values)
+        k = int(rng.integers(2, 5))
+        if len(x) <= k:
+            continue
+        best = min(class_cost(values, np.searchsorted(x[list(cuts)], values, side="right"))
+                   for cuts in itertools.combinations(range(1, len(x)), k - 1))
+        breaks = cf.jenks_breaks(values, k)
+        assert len(breaks) == k + 1
+        assert np.isclose(class_cost(values, cf.class_bins(values, breaks)), best)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# tests for appended parquet tables
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import data_store as ds
+
+# function to create incident rows
+def incidents(ids, n_places):
+    """
+    Pass incident ids and number of distinct places.
+    Returns df laid out like df_gun_violence
+    """
+    n = len(ids)
+    return pd.DataFrame({"incident_id": ids,
+                         "incident_date": pd.date_range("2020-01-01", periods=n, freq="h"),
+                         "state": ["Ohio"] * n,
+                         "city_or_county": [f"place {i % n_places}" for i in range(n)],
+                         "address": ["1 Main St"] * n,
+                         "#_killed": 1, "#_injured": 0})
+
+# parts with many and few categories store different index widths
+def test_load_parts_of_different_cardinality(tmp_path):
+    ds.append_table(incidents(range(2000), 2000), "df_gun_violence", tmp_path, "00-0")
+    ds.append_table(incidents(range(5000, 5040), 40), "df_gun_violence", tmp_path, "ff-0")
+    df = ds.load_table("df_gun_violence", tmp_path)
+    assert len(df) == 2040
+    assert df["city_or_county"].dtype == "category"
+    df = ds.load_table("df_gun_violence", tmp_path, columns=["incident_id", "city_or_county"],
+                       filters=[("incident_id", ">=", 5000)])
+    assert df["city_or_county"].tolist() == [f"place {i}" for i in range(40)]
+
+# columns added later read as null for older parts
+def test_load_parts_missing_columns(tmp_path):
+    ds.append_table(incidents(range(10), 10), "df_gun_violence", tmp_path, "00-0")
+    ds.append_table(incidents(range(10, 20), 10).assign(latitude=40.0, longitude=-83.0),
+                    "df_gun_violence", tmp_path, "ff-0")
+    df = ds.load_table("df_gun_violence", tmp_path).sort_values("incident_id")
+    assert np.isnan(df["latitude"].to_numpy()[:10]).all()
+    assert (df["latitude"].to_numpy()[10:] == 40.0).all()
+
+# batches cover the filtered rows of every part once
+def test_iter_table_batches(tmp_path):
+    ds.append_table(incidents(range(2000), 2000), "df_gun_violence", tmp_path, "00-0")
+    ds.append_table(incidents(range(5000, 5040), 40), "df_gun_violence", tmp_path, "ff-0")
+    batches = list(ds.iter_table("df_gun_violence", tmp_path, columns=["incident_id"],
+                                 filters=[("incident_id", ">=", 100)], batch_size=500))
+    assert all(len(df) <= 500 for df in batches)
+    ids = pd.concat(batches)["incident_id"].sort_values().tolist()
+    assert ids == list(range(100, 2000)) + list(range(5000, 5040))
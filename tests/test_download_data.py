@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# tests for export fetchers
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import json
+import pytest
+import requests
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import download_data as dd
+
+# stand in for a streamed requests response
+class FakeResponse:
+    def __init__(self, status_code, chunks=(), headers=None, error=None):
+        self.status_code = status_code
+        self.chunks = chunks
+        self.headers = headers or {}
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"status {self.status_code}", response=self)
+
+    def iter_content(self, chunk_size):
+        yield from self.chunks
+        if self.error is not None:
+            raise self.error
+
+# function to serve responses in order
+def serve(monkeypatch, responses):
+    """
+    Pass pytest monkeypatch and list of FakeResponse.
+    Returns list of request headers sent
+    """
+    sent = []
+
+    def get(url, headers=None, **kwargs):
+        sent.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(dd.requests, "get", get)
+    monkeypatch.setattr(dd.time, "sleep", lambda seconds: None)
+    return sent
+
+# local files copy once, then are unchanged
+def test_fetch_file(tmp_path):
+    source = tmp_path / "source.csv"
+    source.write_text("incident_id\n1\n")
+    status, dest = dd.fetch(str(source), str(tmp_path / "out"))
+    assert status == "downloaded"
+    assert open(dest).read() == "incident_id\n1\n"
+    assert dd.fetch(f"file://{source}", str(tmp_path / "out"))[0] == "not_modified"
+    assert not os.path.exists(dest + ".part")
+
+# saved ETag is sent and 304 keeps the saved copy
+def test_fetch_http_not_modified(tmp_path, monkeypatch):
+    dest = str(tmp_path / "export.csv")
+    with open(dest, "w") as f:
+        f.write("incident_id\n1\n")
+    with open(dest + ".meta.json", "w") as f:
+        json.dump({"etag": '"v1"'}, f)
+    sent = serve(monkeypatch, [FakeResponse(304)])
+    assert dd.fetch_http("https://example.org/export.csv", dest) == "not_modified"
+    assert sent[0]["If-None-Match"] == '"v1"'
+    assert open(dest).read() == "incident_id\n1\n"
+    assert not os.path.exists(dest + ".part")
+
+# a body cut off mid-stream or short of Content-Length is fetched again
+@pytest.mark.parametrize("cut", [
+    FakeResponse(200, [b"incident"], error=requests.exceptions.ChunkedEncodingError("cut")),
+    FakeResponse(200, [b"incident"], {"Content-Length": "14"})])
+def test_fetch_http_truncated_retried(tmp_path, monkeypatch, cut):
+    dest = str(tmp_path / "export.csv")
+    body = FakeResponse(200, [b"incident", b"_id\n1\n"],
+                        {"Content-Length": "14", "ETag": '"v2"'})
+    sent = serve(monkeypatch, [cut, body])
+    assert dd.fetch_http("https://example.org/export.csv", dest) == "downloaded"
+    assert len(sent) == 2
+    assert open(dest).read() == "incident_id\n1\n"
+    assert dd.load_meta(dest)["etag"] == '"v2"'
+    assert not os.path.exists(dest + ".part")
+
+# client errors are not retried
+def test_fetch_http_not_found(tmp_path, monkeypatch):
+    dest = str(tmp_path / "export.csv")
+    sent = serve(monkeypatch, [FakeResponse(404), FakeResponse(200, [b"x"])])
+    with pytest.raises(requests.HTTPError):
+        dd.fetch_http("https://example.org/export.csv", dest)
+    assert len(sent) == 1
+    assert not os.path.exists(dest)
+    assert not os.path.exists(dest + ".part")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# tests for offline geocoding
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import geocode_functions as geo
+import geometry_functions as gf
+
+# gazetteer of a city and its namesake county
+gazetteer = pd.DataFrame({"state": ["Maryland", "Maryland"],
+                          "key": ["baltimore", "baltimore county"],
+                          "latitude": [39.30, 39.44], "longitude": [-76.61, -76.62]})
+address_gazetteer = pd.DataFrame({"state": ["Maryland", "Maryland"],
+                                  "key": ["baltimore", "baltimore"],
+                                  "address_key": ["1 main st", "2 main st"],
+                                  "latitude": [39.31, 39.32],
+                                  "longitude": [-76.60, -76.59]})
+
+# function to create incident rows
+def incidents():
+    return pd.DataFrame({"state": ["Maryland", "Maryland"],
+                         "city_or_county": ["Baltimore", "Baltimore County"],
+                         "address": ["1 Main St", "2 Main St"]})
+
+# address entries in the cache don't add rows to place lookups
+def test_geocode_cache_with_and_without_address(tmp_path):
+    df = incidents()
+    by_address = geo.geocode(df, gazetteer, tmp_path, address_gazetteer)
+    assert by_address["latitude"].tolist() == [39.31, 39.44]
+    by_place = geo.geocode(df.drop(columns="address"), gazetteer, tmp_path)
+    assert by_place["latitude"].tolist() == [39.30, 39.44]
+    # both kinds of entry are cached
+    again = geo.geocode(df, gazetteer, tmp_path, address_gazetteer)
+    assert again["latitude"].tolist() == [39.31, 39.44]
+
+# a row naming a county is placed by name over its geocoded point
+def test_incident_counties_name_first():
+    import geopandas as gpd
+    from shapely.geometry import box
+    counties = gpd.GeoDataFrame({"state_name": ["Maryland", "Maryland"],
+                                 "namelsad": ["Baltimore city", "Baltimore County"],
+                                 "county_fips": ["24510", "24005"]},
+                                geometry=[box(-76.7, 39.2, -76.5, 39.37),
+                                          box(-76.9, 39.37, -76.3, 39.7)], crs=4326)
+    # both points lie in the city
+    df = incidents().assign(latitude=[39.30, 39.30], longitude=[-76.61, -76.61])
+    county_fips = gf.incident_counties(df, counties)
+    assert county_fips.tolist() == ["24510", "24005"]
+    df.loc[0, ["latitude", "longitude"]] = np.nan
+    assert pd.isna(gf.incident_counties(df, counties).iloc[0])
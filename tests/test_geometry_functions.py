@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# tests for county name matching
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import pytest
+import pandas as pd
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import geometry_functions as gf
+import geocode_functions as geo
+
+# counties keep their suffix, cities drop theirs
+def test_place_key():
+    names = pd.Series(["St. Louis County", "St. Louis city", "Ste. Genevieve County",
+                       "Charles City County", "Honolulu (Urban Honolulu)", None])
+    keys = gf.place_key(names)
+    assert keys.tolist()[:5] == ["saint louis county", "saint louis",
+                                 "sainte genevieve county", "charles city county",
+                                 "honolulu"]
+    assert keys.isna().iloc[5]
+    assert geo.place_key is gf.place_key
+
+# rows naming a county match the county, not its namesake city
+def test_match_county_names():
+    counties = pd.DataFrame({"state_name": ["Maryland", "Maryland", "Missouri", "Missouri",
+                                            "Virginia", "Illinois"],
+                             "namelsad": ["Baltimore city", "Baltimore County",
+                                          "St. Louis city", "St. Louis County",
+                                          "Charles City County", "Cook County"],
+                             "county_fips": ["24510", "24005", "29510", "29189",
+                                             "51036", "17031"]})
+    df = pd.DataFrame({"state": ["Maryland", "Missouri", "Virginia", "Illinois", "Illinois"],
+                       "city_or_county": ["Baltimore County", "St. Louis County",
+                                          "Charles City County", "Chicago", "Cook County"]})
+    county_fips = gf.match_county_names(df, counties)
+    assert county_fips.tolist()[:3] == ["24005", "29189", "51036"]
+    assert pd.isna(county_fips.iloc[3])
+    assert county_fips.iloc[4] == "17031"
+
+# two counties with one key is an error, not a guess
+def test_match_county_names_duplicate():
+    counties = pd.DataFrame({"state_name": ["Maryland", "Maryland"],
+                             "namelsad": ["Baltimore County", "Baltimore county"],
+                             "county_fips": ["24005", "24006"]})
+    df = pd.DataFrame({"state": ["Maryland"], "city_or_county": ["Baltimore County"]})
+    with pytest.raises(ValueError):
+        gf.match_county_names(df, counties)
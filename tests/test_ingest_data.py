@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# tests for incremental ingestion of GVA exports
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import shutil
+import pandas as pd
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import data_store as ds
+import ingest_data as ingest
+
+# function to write GVA export
+def write_export(file, ids):
+    """
+    Pass file path and incident ids.
+    Writes export csv laid out like the GVA download, one incident
+    every 10 days from 2022-01-01 over two states
+    """
+    dates = pd.Timestamp("2022-01-01") + pd.to_timedelta([10 * (i % 30) for i in ids], "D")
+    pd.DataFrame({"Incident ID": ids,
+                  "Incident Date": [f"{d:%B} {d.day}, {d.year}" for d in dates],
+                  "State": ["Ohio" if i % 2 else "Utah" for i in ids],
+                  "City Or County": [f"Place {i % 5}" for i in ids],
+                  "Address": ["1 Main St"] * len(ids),
+                  "# Killed": [i % 3 for i in ids],
+                  "# Injured": [4 - i % 3 for i in ids],
+                  "Operations": ["N/A"] * len(ids)}).to_csv(file, index=False)
+
+# function to load stored tables
+def stored(store, agg_store):
+    """
+    Pass store and aggregate directories.
+    Returns sorted incident ids and monthly aggregates
+    """
+    ids = ds.load_table(ingest.INCIDENT_TABLE, store)["incident_id"].sort_values().tolist()
+    df_month = ds.load_table(ingest.MONTHLY_TABLE, agg_store)\
+    .sort_values(["date", "state"]).reset_index(drop=True)
+    df_month["state"] = df_month["state"].astype(str)
+    return ids, df_month
+
+# new rows are deduped on incident_id and files are read once
+def test_ingest_dedupe_and_skip(tmp_path):
+    exports, store, agg_store = tmp_path / "exports", tmp_path / "store", tmp_path / "agg"
+    os.makedirs(exports)
+    # second export repeats ids 40-59 and one of its own rows
+    write_export(exports / "export-a.csv", list(range(60)))
+    write_export(exports / "export-b.csv", list(range(40, 100)) + [99])
+    assert ingest.ingest(exports, store, agg_store, chunksize=25) == 100
+    ids, df_month = stored(store, agg_store)
+    assert ids == list(range(100))
+    assert df_month["count"].sum() == 100
+
+    # rerun and a renamed copy of an ingested file add nothing
+    shutil.copy(exports / "export-a.csv", exports / "export-c.csv")
+    assert ingest.ingest(exports, store, agg_store, chunksize=25) == 0
+    ids_again, df_month_again = stored(store, agg_store)
+    assert ids_again == ids
+    pd.testing.assert_frame_equal(df_month_again, df_month)
+
+# parts left by a crashed run are replaced on the rerun
+def test_ingest_rerun_after_crash(tmp_path):
+    exports, store, agg_store = tmp_path / "exports", tmp_path / "store", tmp_path / "agg"
+    os.makedirs(exports)
+    write_export(exports / "export-a.csv", list(range(60)))
+    write_export(exports / "export-b.csv", list(range(40, 100)))
+
+    # clean run in another store
+    ingest.ingest(exports, tmp_path / "clean", tmp_path / "clean_agg", chunksize=25)
+    expected = stored(tmp_path / "clean", tmp_path / "clean_agg")
+
+    # crash after writing the first part of export-b, before its manifest entry
+    os.rename(exports / "export-b.csv", tmp_path / "export-b.csv")
+    ingest.ingest(exports, store, agg_store, chunksize=25)
+    digest = ingest.file_hash(tmp_path / "export-b.csv")
+    first = next(ingest.read_export_chunks(tmp_path / "export-b.csv", 25))
+    ds.append_table(first[first["incident_id"] >= 60].assign(latitude=float("nan"),
+                                                             longitude=float("nan")),
+                    ingest.INCIDENT_TABLE, store, f"{digest[:16]}-0")
+    os.rename(tmp_path / "export-b.csv", exports / "export-b.csv")
+
+    assert ingest.ingest(exports, store, agg_store, chunksize=25) == 40
+    ids, df_month = stored(store, agg_store)
+    assert ids == expected[0]
+    pd.testing.assert_frame_equal(df_month, expected[1])
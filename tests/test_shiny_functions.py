@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# tests for rates with confidence intervals
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import math
+import numpy as np
+import pandas as pd
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import shiny_functions as sf
+
+# function to get exact poisson interval of one count
+def garwood(k, alpha=0.05):
+    """
+    Pass count.
+    Bisects the poisson cdf summed term by term.
+    Returns low and high expected counts
+    """
+    def cdf(k, mu):
+        return sum(math.exp(i * math.log(mu) - mu - math.lgamma(i + 1))
+                   for i in range(k + 1))
+
+    def mean(k, target):
+        low, high = 0.0, k + 10 * math.sqrt(k + 1) + 10
+        for _ in range(100):
+            mid = (low + high) / 2
+            (low, high) = (mid, high) if cdf(k, mid) > target else (low, mid)
+        return (low + high) / 2
+
+    return (mean(k - 1, 1 - alpha / 2) if k > 0 else 0.0), mean(k, alpha / 2)
+
+# known exact limits
+def test_poisson_interval_garwood():
+    low, high = sf.poisson_interval([0, 10])
+    assert np.allclose(low, [0.0, 4.795], atol=1e-3)
+    assert np.allclose(high, [3.689, 18.39], atol=1e-2)
+
+# exact below EXACT_MAX and Byar's above agree with exact limits
+def test_poisson_interval_around_exact_max():
+    counts = np.arange(sf.EXACT_MAX - 3, sf.EXACT_MAX + 10)
+    low, high = sf.poisson_interval(counts)
+    expected = np.array([garwood(int(k)) for k in counts])
+    assert np.allclose(low, expected[:, 0], rtol=1e-3)
+    assert np.allclose(high, expected[:, 1], rtol=1e-3)
+
+# no population or no count is no rate
+def test_rates_missing():
+    result = sf.rates([[5.0], [5.0], [np.nan]], [np.nan, 0, 1000])
+    for values in result.values():
+        assert np.isnan(values).all()
+    result = sf.rates([[5.0]], [1000], base=100_000)
+    assert result["rate"][0, 0] == 500.0
+    assert result["low"][0, 0] < 500.0 < result["high"][0, 0]
+
+# rate table adds rate cols and leaves its input alone
+def test_rate_table_no_change():
+    df = pd.DataFrame({"state": ["Ohio", "Utah", "Iowa"], "count": [10.0, np.nan, 3.0],
+                       "population": [100_000.0, 50_000.0, np.nan]})
+    before = df.copy()
+    df_rates = sf.rate_table(df, ["count"], ["count_per_1k"])
+    pd.testing.assert_frame_equal(df, before)
+    assert df_rates["count_per_1k"].tolist()[:2] == [10.0, 0.0]
+    assert np.isnan(df_rates["count_per_1k"].iloc[2])
+    assert {"count_per_1k_low", "count_per_1k_high"} <= set(df_rates.columns)
+
+# date range sums from the cube match a groupby of the rows in range
+def test_cube_range_sum_matches_groupby():
+    import data_store as ds
+    df = ds.load_table("df_yr_mon_state", os.path.join(os.path.dirname(
+        os.path.abspath(__file__)), "..", "my_app", "data"))
+    value_list = ["count", "#_injured", "#_killed", "total_injured_killed"]
+    cube = sf.build_cumulative_cube(df, value_list)
+    dates = pd.to_datetime(df["date"])
+    ranges = [("2019-10-01", "2023-01-01"),   # full range
+              ("2020-03-15", "2021-07-01"),   # partial months
+              ("2021-05-01", "2021-05-01"),   # empty
+              ("2022-12-15", "2023-01-01"),   # start inside the last month
+              ("2022-06-01", "2024-01-01")]   # past the last month
+    for (start, end) in ranges:
+        in_range = df[(dates >= start) & (dates < end)]
+        expected = sf.groupby_mult(in_range, ["state"], {col: "sum" for col in value_list},
+                                   value_list[:1]).sort_values("state").reset_index(drop=True)
+        result = sf.cube_range_sum(cube, pd.Timestamp(start).date(), pd.Timestamp(end).date(),
+                                   value_list[:1]).sort_values("state").reset_index(drop=True)
+        assert len(result) == len(expected)
+        if len(expected):
+            pd.testing.assert_frame_equal(result[["state"] + value_list],
+                                          expected[["state"] + value_list],
+                                          check_dtype=False)
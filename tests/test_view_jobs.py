@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# tests for map views shared between sessions
+# run from project root: python -m pytest -q tests
+# import packages
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# import functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "my_app"))
+import view_jobs
+
+# function standing in for compute_view
+def compute(name, gate=None):
+    if gate is not None:
+        gate.wait(5)
+    return name
+
+# a queued view nobody waits for is cancelled and forgotten
+def test_release_queued_view():
+    gate = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        busy = view_jobs.submit(executor, compute, ("a", gate))
+        queued = view_jobs.submit(executor, compute, ("b",))
+        # a second session joins the queued view
+        assert view_jobs.submit(executor, compute, ("b",)) is queued
+        view_jobs.release(compute, ("b",), queued)
+        assert not queued.cancelled()
+        view_jobs.release(compute, ("b",), queued)
+        assert queued.cancelled()
+        # asking again starts a new view
+        again = view_jobs.submit(executor, compute, ("b",))
+        assert again is not queued
+        gate.set()
+        assert busy.result(5) == "a" and again.result(5) == "b"
+        # releasing a finished view does nothing
+        view_jobs.release(compute, ("b",), again)
+    assert view_jobs.running() == 0